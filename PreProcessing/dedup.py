@@ -0,0 +1,320 @@
+"""Near-duplicate story removal with MinHash and locality-sensitive hashing.
+
+    python PreProcessing/dedup.py --in-place
+    python PreProcessing/dedup.py PreProcessing/urdu_stories_processed.csv --output deduped.csv --threshold 0.8 --shingle bpe
+
+Each story is shingled into character (or BPE id) k-grams and summarised by
+a MinHash signature. Signatures are split into bands, and only stories that
+share a band bucket are compared, so the work grows roughly linearly with
+the number of stories. Candidate pairs whose estimated Jaccard similarity
+reaches --threshold are merged into clusters. The first story of each
+cluster is kept, and the clusters are written to a JSON report. The kept
+stories go to --output, or replace the input only with --in-place.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+import pandas as pd
+
+SHINGLE_BASE = np.uint64(0x100000001B3)
+# Band buckets with up to this many stories are compared pairwise
+MAX_BUCKET_PAIRS = 64
+
+
+def _mix64(h):
+    """splitmix64 finaliser, so shingle hashes use all 64 bits"""
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def shingle_hashes(symbols, k):
+    """Distinct 64-bit hashes of the k-grams of a uint64 symbol array (the whole array if shorter than k)"""
+    n = len(symbols) - k + 1
+    if n <= 0:
+        k, n = len(symbols), 1
+    h = np.zeros(n, dtype=np.uint64)
+    # Polynomial hash of every window at once, wrapping modulo 2**64
+    for j in range(k):
+        h = h * SHINGLE_BASE + symbols[j:j + n]
+    return np.unique(_mix64(h))
+
+
+def char_symbols(text):
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+
+
+class MinHasher:
+    """num_perm multiply-shift hash functions applied to shingle hashes"""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    def signatures(self, shingle_sets, max_values=1 << 16):
+        """(len(shingle_sets), num_perm) uint32 signatures; every set must be non-empty"""
+        lengths = np.array([len(s) for s in shingle_sets])
+        hashes = np.concatenate(shingle_sets)
+        # As many hash functions per pass as keep the intermediate array around max_values entries
+        block = max(1, min(self.num_perm, max_values // len(hashes)))
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        out = np.empty((len(shingle_sets), self.num_perm), dtype=np.uint32)
+        # A block of hash functions over every story's shingles at once, reduced per story
+        for p in range(0, self.num_perm, block):
+            a = self.a[p:p + block, None]
+            b = self.b[p:p + block, None]
+            values = (hashes[None, :] * a + b) >> np.uint64(32)
+            out[:, p:p + block] = np.minimum.reduceat(values, starts, axis=1).T
+        return out
+
+
+def lsh_params(threshold, num_perm, weights=(0.1, 0.9)):
+    """(bands, rows) minimising the weighted false positive and false negative areas around threshold
+
+    Every candidate pair is verified against its signatures afterwards, so false
+    negatives (missed duplicates) are weighted far above false positives.
+    """
+    best, best_error = (1, num_perm), float("inf")
+    s = np.linspace(0, 1, 201)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        p = 1 - (1 - s ** rows) ** bands  # Probability that a pair with similarity s becomes a candidate
+        below = s < threshold
+        false_positive = p[below].sum() / len(s)
+        false_negative = (1 - p[~below]).sum() / len(s)
+        error = weights[0] * false_positive + weights[1] * false_negative
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+def candidate_pairs(signatures, bands, rows, seed=2):
+    """(i, j) row pairs, i < j, that share at least one band bucket"""
+    n = len(signatures)
+    multipliers = np.random.default_rng(seed).integers(1, 2 ** 63, size=rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    pairs = []
+    for band in range(bands):
+        block = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = _mix64((block * multipliers).sum(axis=1, dtype=np.uint64))
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]]))
+        ends = np.append(starts[1:], n)
+        shared = ends - starts > 1
+        for start, end in zip(starts[shared].tolist(), ends[shared].tolist()):
+            members = order[start:end]
+            if len(members) <= MAX_BUCKET_PAIRS:
+                # All pairs, so a story similar only to a later member of the bucket is still compared
+                i, j = np.triu_indices(len(members), 1)
+                pairs.append(np.stack([members[i], members[j]], axis=1))
+            else:
+                # Huge buckets are nearly always one duplicate family: pair each member with the
+                # first and with its neighbour instead of quadratically many pairs
+                pairs.append(np.stack([np.repeat(members[0], len(members) - 1), members[1:]], axis=1))
+                pairs.append(np.stack([members[:-1], members[1:]], axis=1))
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.concatenate(pairs)
+    pairs.sort(axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def find_clusters(signatures, threshold, bands, rows):
+    """(clusters, verified pair count); a cluster lists the signature indices, ascending, of
+    stories whose estimated similarity to another member reaches threshold"""
+    pairs = candidate_pairs(signatures, bands, rows)
+    similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1) if len(pairs) else np.zeros(0)
+    keep = similarity >= threshold
+    pairs, similarity = pairs[keep], similarity[keep]
+
+    parent = list(range(len(signatures)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs.tolist():
+        ri, rj = root(i), root(j)
+        if ri != rj:
+            # The lower row number becomes the root, so it is the story kept
+            parent[max(ri, rj)] = min(ri, rj)
+
+    groups = {}
+    for i in np.unique(pairs).tolist():
+        groups.setdefault(root(i), []).append(i)
+    return [sorted(members) for _, members in sorted(groups.items())], len(pairs)
+
+
+# Each worker loads the tokenizer once when shingling on BPE ids
+_worker_tokenizer = None
+_worker_hasher = None
+_worker_k = 5
+
+
+def _init_worker(num_perm, seed, k, tokenizer_path):
+    global _worker_tokenizer, _worker_hasher, _worker_k
+    _worker_hasher = MinHasher(num_perm, seed)
+    _worker_k = k
+    if tokenizer_path:
+        sys.path.append(os.getcwd())
+        import Tokenizer.bpe_tokenizer as bpe_tokenizer
+        sys.modules['bpe_tokenizer'] = bpe_tokenizer
+        _worker_tokenizer = bpe_tokenizer.BPETokenizer.load(tokenizer_path)
+
+
+def _signature_chunk(texts):
+    if _worker_tokenizer is not None:
+        symbols = [np.asarray(_worker_tokenizer.encode(text), dtype=np.uint64) for text in texts]
+    else:
+        symbols = [char_symbols(text) for text in texts]
+    # Empty stories still need one shingle for the reduction
+    return _worker_hasher.signatures([shingle_hashes(s, _worker_k) if len(s) else np.zeros(1, dtype=np.uint64)
+                                      for s in symbols])
+
+
+def iter_chunks(csv_path, column, chunk_rows):
+    """(row numbers, texts) of the non-empty stories, chunk_rows rows at a time"""
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        texts = chunk[column].dropna()
+        if len(texts):
+            yield texts.index.to_numpy(), [str(text) for text in texts.tolist()]
+
+
+def signature_chunks(text_chunks, workers, initargs):
+    """Signatures of each chunk of texts, in order, across a process pool when workers > 1"""
+    if workers <= 1:
+        _init_worker(*initargs)
+        yield from map(_signature_chunk, text_chunks)
+        return
+    with Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+        yield from pool.imap(_signature_chunk, text_chunks)
+
+
+def compute_signatures(csv_path, column, chunk_rows, workers, num_perm, seed, k, tokenizer_path):
+    """Row numbers and MinHash signatures of every non-empty story in the CSV"""
+    row_ids, signatures = [], []
+
+    def text_chunks():
+        # Row numbers stay in this process; only the texts go to the workers
+        for rows, texts in iter_chunks(csv_path, column, chunk_rows):
+            row_ids.append(rows)
+            yield texts
+
+    for sigs in signature_chunks(text_chunks(), workers, (num_perm, seed, k, tokenizer_path)):
+        signatures.append(sigs)
+        print(f"Signed {sum(len(s) for s in signatures)} stories")
+    if not signatures:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, num_perm), dtype=np.uint32)
+    return np.concatenate(row_ids), np.concatenate(signatures)
+
+
+def write_deduplicated(csv_path, output_path, column, chunk_rows, removed, previews):
+    """Copy the CSV without the removed rows; fills previews with the start of every clustered story"""
+    tmp_path = output_path + ".tmp"
+    kept = 0
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        header = True
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+            for row in chunk.index.intersection(list(previews)):
+                previews[row] = str(chunk.at[row, column])[:80]
+            chunk = chunk[~chunk.index.isin(removed)]
+            chunk.to_csv(f, index=False, header=header)
+            header = False
+            kept += len(chunk)
+    # Written to a temporary file first, so the input can be replaced in place
+    os.replace(tmp_path, output_path)
+    return kept
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Remove near-duplicate stories with MinHash LSH")
+    parser.add_argument("input", nargs="?", default="PreProcessing/urdu_stories_processed.csv")
+    parser.add_argument("--output", help="Deduplicated CSV")
+    parser.add_argument("--in-place", action="store_true", help="Replace the input with the deduplicated CSV")
+    parser.add_argument("--report", default="PreProcessing/dedup_report.json", help="Cluster report (JSON)")
+    parser.add_argument("--column", default="content", help="Column holding the story text")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Estimated Jaccard similarity of duplicates")
+    parser.add_argument("--shingle", choices=("char", "bpe"), default="char", help="Shingle characters or BPE ids")
+    parser.add_argument("--k", type=int, help="Shingle length (default: 5 characters or 3 BPE ids)")
+    parser.add_argument("--tokenizer", default="Tokenizer/bpe_tokenizer.pkl", help="Tokenizer for --shingle bpe")
+    parser.add_argument("--num-perm", type=int, default=128, help="MinHash signature length")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Stories read and signed per task")
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    args = parser.parse_args()
+    # A bad threshold would otherwise destroy the source data
+    if not args.in_place and (args.output is None or os.path.abspath(args.output) == os.path.abspath(args.input)):
+        parser.error("give --output for the deduplicated CSV, or --in-place to replace the input")
+    if args.in_place and args.output is not None:
+        parser.error("--output and --in-place are mutually exclusive")
+    return args
+
+
+def main():
+    args = parse_args()
+    output_path = args.output or args.input
+    k = args.k or (3 if args.shingle == "bpe" else 5)
+    tokenizer_path = args.tokenizer if args.shingle == "bpe" else None
+    bands, rows = lsh_params(args.threshold, args.num_perm)
+    print(f"MinHash with {args.num_perm} permutations, {bands} bands of {rows} rows, {args.shingle} {k}-grams")
+
+    start = time.perf_counter()
+    row_ids, signatures = compute_signatures(args.input, args.column, args.chunk_size, args.workers,
+                                             args.num_perm, args.seed, k, tokenizer_path)
+    sign_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    clusters, verified_pairs = find_clusters(signatures, args.threshold, bands, rows)
+    lsh_seconds = time.perf_counter() - start
+
+    removed = set()
+    previews = {}
+    report_clusters = []
+    for members in clusters:
+        rows_in_csv = row_ids[members]
+        kept_sig = signatures[members[0]]
+        report_clusters.append({
+            "kept": int(rows_in_csv[0]),
+            "removed": [int(r) for r in rows_in_csv[1:]],
+            "similarity": [round(float((signatures[m] == kept_sig).mean()), 3) for m in members[1:]],
+        })
+        removed.update(int(r) for r in rows_in_csv[1:])
+        previews.update((int(r), None) for r in rows_in_csv)
+
+    kept = write_deduplicated(args.input, output_path, args.column, args.chunk_size, removed, previews)
+    for cluster in report_clusters:
+        cluster["preview"] = {str(r): previews[r] for r in [cluster["kept"]] + cluster["removed"]}
+
+    report = {
+        "input": args.input,
+        "output": output_path,
+        "stories": int(len(row_ids)),
+        "kept": kept,
+        "removed": len(removed),
+        "clusters": len(report_clusters),
+        "params": {"threshold": args.threshold, "shingle": args.shingle, "k": k, "num_perm": args.num_perm,
+                   "bands": bands, "rows": rows, "seed": args.seed},
+        "verified_pairs": verified_pairs,
+        "sign_seconds": sign_seconds,
+        "lsh_seconds": lsh_seconds,
+        "duplicate_clusters": sorted(report_clusters, key=lambda c: -len(c["removed"])),
+    }
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Removed {len(removed)} near-duplicates in {len(report_clusters)} clusters; "
+          f"{kept} rows written to {output_path}, report in {args.report}")
+
+
+if __name__ == "__main__":
+    main()
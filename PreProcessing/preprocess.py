@@ -0,0 +1,133 @@
+"""Cleaning pipeline of pre_processing.ipynb as a module and CLI.
+
+    python PreProcessing/preprocess.py scaper/all_urdu_moral_stories.csv
+
+Reads the scraped stories CSV in chunks, cleans them across a process pool
+and writes PreProcessing/urdu_stories_processed.csv (one `content` column)
+in a single pass, with the same output as the notebook's steps.
+"""
+import argparse
+import os
+import re
+import time
+import unicodedata
+from multiprocessing import Pool, cpu_count
+
+import pandas as pd
+
+# Special tokens in unused Unicode code points
+EOS = '\uFFF0'  # End of Sentence
+EOP = '\uFFF1'  # End of Paragraph
+EOT = '\uFFF2'  # End of Story/Text
+
+# Patterns are compiled once instead of per call. Single characters are swapped
+# with str.replace: str.translate walks non-ASCII text one code point at a time
+# and is several times slower on Urdu stories.
+ENGLISH_CHARACTERS = re.compile(r'[a-zA-Z]+')
+REPEATED_PUNCTUATION = re.compile(r'([۔؟!])\1+')
+
+
+def remove_english_characters(text):
+    """Remove English characters (a-z, A-Z) from text while keeping Urdu and digits"""
+    return ENGLISH_CHARACTERS.sub('', text)
+
+
+def normalize_unicode(text):
+    """Normalize Unicode to NFC form for consistent representation"""
+    return unicodedata.normalize('NFC', text)
+
+
+def standardize_punctuation(text):
+    """Standardize dashes, collapse whitespace runs to one space and repeated ۔؟! to one"""
+    text = text.replace('–', '-').replace('—', '-')
+    # Same result as re.sub(r'\s+', ' ', text), but str.split is faster
+    words = text.split()
+    collapsed = ' '.join(words)
+    if not words:
+        collapsed = ' ' if text else ''
+    else:
+        if text[0].isspace():
+            collapsed = ' ' + collapsed
+        if text[-1].isspace():
+            collapsed += ' '
+    return REPEATED_PUNCTUATION.sub(r'\1', collapsed)
+
+
+def preprocess_urdu_text(text):
+    """Apply all cleaning steps"""
+    text = remove_english_characters(text)
+    text = normalize_unicode(text)
+    text = standardize_punctuation(text)
+    return text.strip()
+
+
+def add_special_tokens(text):
+    """Add special tokens to mark sentence, paragraph, and story ends"""
+    text = text.replace('۔', f'۔{EOS}')  # Period
+    text = text.replace('؟', f'؟{EOS}')  # Question mark
+    text = text.replace('!', f'!{EOS}')  # Exclamation
+    # Paragraphs (whitespace is collapsed before this, so only for text not from preprocess_urdu_text)
+    text = text.replace('\n', f'{EOP}\n')
+    return text.rstrip() + EOT
+
+
+def process_story(text):
+    return add_special_tokens(preprocess_urdu_text(text))
+
+
+def process_chunk(texts):
+    return [process_story(text) for text in texts]
+
+
+def iter_chunks(csv_path, column, chunk_rows):
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, usecols=[column]):
+        texts = [str(text) for text in chunk[column].dropna().tolist()]
+        if texts:
+            yield texts
+
+
+def clean_chunks(chunks, workers):
+    """Cleaned chunks in input order, cleaned across a process pool when workers > 1"""
+    if workers <= 1:
+        yield from map(process_chunk, chunks)
+        return
+    with Pool(workers) as pool:
+        yield from pool.imap(process_chunk, chunks)
+
+
+def preprocess_csv(input_path, output_path, column='content', chunk_rows=1000, workers=None):
+    """Clean every story of input_path into a one-column `content` CSV; returns the number of stories"""
+    chunks = iter_chunks(input_path, column, chunk_rows)
+    # Written to a temporary file first, so the training scripts never read a half-written corpus
+    tmp_path = output_path + '.tmp'
+    stories = 0
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write('content\n')
+        for cleaned in clean_chunks(chunks, workers or cpu_count()):
+            pd.DataFrame({'content': cleaned}).to_csv(f, index=False, header=False)
+            stories += len(cleaned)
+            print(f"Processed {stories} stories")
+    os.replace(tmp_path, output_path)
+    return stories
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Clean scraped Urdu stories and add special tokens")
+    parser.add_argument("input", help="Scraped stories CSV (e.g. from scaper/converter.py)")
+    parser.add_argument("--output", default="PreProcessing/urdu_stories_processed.csv")
+    parser.add_argument("--column", default="content", help="Column holding the story text")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Stories read and cleaned per task")
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    stories = preprocess_csv(args.input, args.output, args.column, args.chunk_size, args.workers)
+    print(f"Preprocessing complete! {stories} stories written to {args.output} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
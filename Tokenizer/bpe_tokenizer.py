@@ -1,14 +1,83 @@
+import heapq
 import pickle
+import re
 from collections import defaultdict, Counter
+from functools import lru_cache
+
+# Training splits the corpus after every space byte, so words are encoded
+# independently and their encodings can be cached
+WORD_PATTERN = re.compile(rb'[^ ]* |[^ ]+')
 
 class BPETokenizer:
-    def __init__(self, vocab_size=1500):
+    def __init__(self, vocab_size=1500, word_cache_size=65536):
         """Initialize Byte-level BPE tokenizer"""
         self.vocab_size = vocab_size
         self.vocab = {bytes([i]): i for i in range(256)}
         self.id_to_token = {i: bytes([i]) for i in range(256)}
         self.merges = []  # List of ((p1_bytes, p2_bytes), new_token_bytes)
         self.token_id = 256
+        self.word_cache_size = word_cache_size
+        self._reset_encoder()
+
+    def __getstate__(self):
+        # The rank table and word cache are rebuilt lazily and are not pickled
+        state = self.__dict__.copy()
+        state.pop('_merge_ranks', None)
+        state.pop('_encode_word_cached', None)
+        state.pop('_split_words', None)
+        return state
+
+    def _reset_encoder(self):
+        """Drop the merge-rank table and word cache so they are rebuilt from the current merges"""
+        self._merge_ranks = None
+        self._encode_word_cached = None
+        self._split_words = True
+
+    def _build_encoder(self):
+        """Build the merge-rank table and the LRU cache of word encodings"""
+        ranks = {}
+        for rank, (pair, _) in enumerate(self.merges):
+            ranks.setdefault(pair, rank)
+        # Word-level encoding is only exact if no merge crosses a space, which
+        # holds for tokenizers trained by train() but is checked for old pickles
+        self._split_words = not any(b' ' in pair[0] for pair, _ in self.merges)
+        self._encode_word_cached = lru_cache(maxsize=getattr(self, 'word_cache_size', 65536))(self._encode_word)
+        self._merge_ranks = ranks
+
+    def _encode_word(self, word):
+        """Encode one word by repeatedly merging its lowest-ranked adjacent pair"""
+        ranks = self._merge_ranks
+        parts = [bytes([b]) for b in word]
+        nxt = list(range(1, len(parts))) + [-1]
+        prv = list(range(-1, len(parts) - 1))
+        # Heap of (rank, left position) over a linked list of the current tokens;
+        # equal ranks pop left to right, matching one in-order pass per merge
+        heap = []
+        for i in range(len(parts) - 1):
+            rank = ranks.get((parts[i], parts[i + 1]))
+            if rank is not None:
+                heap.append((rank, i))
+        heapq.heapify(heap)
+
+        while heap:
+            rank, i = heapq.heappop(heap)
+            j = nxt[i]
+            # Skip entries whose pair changed after they were pushed
+            if parts[i] is None or j < 0 or ranks.get((parts[i], parts[j])) != rank:
+                continue
+            parts[i] = self.merges[rank][1]
+            parts[j] = None
+            nxt[i] = nxt[j]
+            if nxt[i] >= 0:
+                prv[nxt[i]] = i
+            # Merges are applied in learned order, so only later merges may use the new token
+            for left in (prv[i], i):
+                if left >= 0 and nxt[left] >= 0:
+                    new_rank = ranks.get((parts[left], parts[nxt[left]]))
+                    if new_rank is not None and new_rank > rank:
+                        heapq.heappush(heap, (new_rank, left))
+
+        return tuple(self.vocab[t] for t in parts if t is not None and t in self.vocab)
         
     def get_stats(self, split_text):
         """Find the most frequent pair of tokens in the corpus"""
@@ -35,8 +104,92 @@ class BPETokenizer:
             new_split[tuple(new_tokens)] = freq
         return new_split
 
-    def train(self, text):
-        """Train BPE tokenizer on raw text by treating it as a sequence of bytes"""
+    def incremental_best_pairs(self, split_text):
+        """Yield the best pair to merge next, updating pair counts only in words that contain it"""
+        words = [list(word) for word in split_text]
+        freqs = list(split_text.values())
+        # Pair counts plus an inverted index from each pair to the words containing it
+        pair_counts = defaultdict(int)
+        pair_words = defaultdict(set)
+        for wi, tokens in enumerate(words):
+            for i in range(len(tokens) - 1):
+                pair = (tokens[i], tokens[i + 1])
+                pair_counts[pair] += freqs[wi]
+                pair_words[pair].add(wi)
+        heap = [(-count, pair) for pair, count in pair_counts.items()]
+        heapq.heapify(heap)
+
+        def first_occurrence(pair):
+            wi = min(pair_words[pair])
+            tokens = words[wi]
+            for i in range(len(tokens) - 1):
+                if tokens[i] == pair[0] and tokens[i + 1] == pair[1]:
+                    return wi, i
+
+        while True:
+            # Drop stale heap entries left behind by earlier count updates
+            while heap and pair_counts.get(heap[0][1], 0) != -heap[0][0]:
+                heapq.heappop(heap)
+            if not heap:
+                return
+            # max() in get_stats picks the first pair in corpus order among ties
+            best_count = -heap[0][0]
+            tied = set()
+            while heap and -heap[0][0] == best_count:
+                _, pair = heapq.heappop(heap)
+                if pair_counts.get(pair, 0) == best_count:
+                    tied.add(pair)
+            best_pair = min(tied, key=first_occurrence)
+            for pair in tied - {best_pair}:
+                heapq.heappush(heap, (-best_count, pair))
+
+            yield best_pair
+
+            new_token = best_pair[0] + best_pair[1]
+            changed = set()
+            for wi in list(pair_words[best_pair]):
+                tokens, freq = words[wi], freqs[wi]
+                old_pairs = set()
+                for i in range(len(tokens) - 1):
+                    pair = (tokens[i], tokens[i + 1])
+                    pair_counts[pair] -= freq
+                    old_pairs.add(pair)
+                new_tokens = []
+                i = 0
+                while i < len(tokens):
+                    if i < len(tokens) - 1 and tokens[i] == best_pair[0] and tokens[i + 1] == best_pair[1]:
+                        new_tokens.append(new_token)
+                        i += 2
+                    else:
+                        new_tokens.append(tokens[i])
+                        i += 1
+                new_pairs = set()
+                for i in range(len(new_tokens) - 1):
+                    pair = (new_tokens[i], new_tokens[i + 1])
+                    pair_counts[pair] += freq
+                    new_pairs.add(pair)
+                for pair in old_pairs - new_pairs:
+                    pair_words[pair].discard(wi)
+                for pair in new_pairs:
+                    pair_words[pair].add(wi)
+                changed |= old_pairs | new_pairs
+                words[wi] = new_tokens
+
+            for pair in changed:
+                count = pair_counts[pair]
+                if count > 0:
+                    heapq.heappush(heap, (-count, pair))
+                else:
+                    del pair_counts[pair]
+                    pair_words.pop(pair, None)
+
+    def train(self, text, incremental=False):
+        """Train BPE tokenizer on raw text by treating it as a sequence of bytes.
+
+        With incremental=True, pair counts are updated only for words containing
+        the merged pair instead of being recomputed over the whole corpus. The
+        learned merges and vocab are identical to the default mode.
+        """
         # Convert entire text to bytes
         if isinstance(text, str):
             corpus_bytes = text.encode('utf-8')
@@ -70,12 +223,17 @@ class BPETokenizer:
         num_merges = self.vocab_size - len(self.vocab)
         print(f"Starting merges. Target vocab: {self.vocab_size}, Initial: {len(self.vocab)}")
 
+        best_pairs = self.incremental_best_pairs(split_text) if incremental else None
         for i in range(num_merges):
-            pairs = self.get_stats(split_text)
-            if not pairs:
-                break
-            
-            best_pair = max(pairs, key=pairs.get)
+            if incremental:
+                best_pair = next(best_pairs, None)
+                if best_pair is None:
+                    break
+            else:
+                pairs = self.get_stats(split_text)
+                if not pairs:
+                    break
+                best_pair = max(pairs, key=pairs.get)
             new_token = best_pair[0] + best_pair[1]
             
             self.vocab[new_token] = self.token_id
@@ -83,13 +241,15 @@ class BPETokenizer:
             # Store the actual byte values in merges for accurate encoding
             self.merges.append((best_pair, new_token)) 
             
-            split_text = self.merge_vocab(best_pair, split_text)
+            if not incremental:
+                split_text = self.merge_vocab(best_pair, split_text)
             self.token_id += 1
             
             if (i + 1) % 100 == 0:
                 print(f"Merge {i + 1}: {len(self.vocab)} tokens")
 
         print(f"BPE Training Complete. Final Vocab Size: {len(self.vocab)}")
+        self._reset_encoder()
         return self
 
     def encode(self, text):
@@ -97,25 +257,18 @@ class BPETokenizer:
         if isinstance(text, str):
             text_bytes = text.encode('utf-8')
         else:
-            text_bytes = text
-            
-        # Initial tokens are individual bytes
-        tokens = [bytes([b]) for b in text_bytes]
-        
-        # Apply merges in the order they were learned
-        for pair, new_token in self.merges:
-            new_tokens = []
-            i = 0
-            while i < len(tokens):
-                if i < len(tokens) - 1 and tokens[i] == pair[0] and tokens[i+1] == pair[1]:
-                    new_tokens.append(new_token)
-                    i += 2
-                else:
-                    new_tokens.append(tokens[i])
-                    i += 1
-            tokens = new_tokens
-            
-        return [self.vocab[t] for t in tokens if t in self.vocab]
+            text_bytes = bytes(text)
+
+        # Ranks and the word cache are built on first use (also for unpickled tokenizers)
+        if getattr(self, '_merge_ranks', None) is None:
+            self._build_encoder()
+        if not self._split_words:
+            return list(self._encode_word(text_bytes))
+
+        ids = []
+        for word in WORD_PATTERN.findall(text_bytes):
+            ids.extend(self._encode_word_cached(word))
+        return ids
 
     def decode(self, token_ids):
         """Decode token IDs back to a string"""
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import random
+import argparse
+from contextlib import redirect_stdout
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bpe_tokenizer import BPETokenizer
+
+URDU_LETTERS = "ابپتٹثجچحخدڈذرڑزژسشصضطظعغفقکگلمنںوہھءیے"
+PUNCTUATION = ["۔", "؟", "!", "،"]
+
+
+def synthetic_urdu_corpus(num_words=60000, lexicon_size=3000, seed=42):
+    """Build a reproducible Urdu-like corpus with a Zipfian word distribution"""
+    rng = random.Random(seed)
+    lexicon = ["".join(rng.choice(URDU_LETTERS) for _ in range(rng.randint(2, 7))) for _ in range(lexicon_size)]
+    weights = [1.0 / (rank + 1) for rank in range(lexicon_size)]
+    words = rng.choices(lexicon, weights=weights, k=num_words)
+    sentences = []
+    for start in range(0, num_words, 12):
+        sentences.append(" ".join(words[start:start + 12]) + rng.choice(PUNCTUATION))
+    return " ".join(sentences)
+
+
+def timed_train(text, vocab_size, incremental):
+    tokenizer = BPETokenizer(vocab_size=vocab_size)
+    start = time.perf_counter()
+    # Silence per-merge progress so only the comparison is printed
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        tokenizer.train(text, incremental=incremental)
+    return tokenizer, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-recount and incremental BPE training")
+    parser.add_argument("--words", type=int, default=60000, help="Number of words in the synthetic corpus")
+    parser.add_argument("--vocab-size", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    text = synthetic_urdu_corpus(num_words=args.words, seed=args.seed)
+    print(f"Synthetic corpus: {args.words} words, {len(text.encode('utf-8'))} bytes")
+
+    full, full_time = timed_train(text, args.vocab_size, incremental=False)
+    incremental, incremental_time = timed_train(text, args.vocab_size, incremental=True)
+
+    identical = full.merges == incremental.merges and full.vocab == incremental.vocab
+    print(f"Full recount: {full_time:.2f}s ({len(full.merges)} merges)")
+    print(f"Incremental:  {incremental_time:.2f}s ({len(incremental.merges)} merges)")
+    print(f"Speedup: {full_time / incremental_time:.1f}x")
+    print(f"Identical merges and vocab: {identical}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
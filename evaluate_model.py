@@ -0,0 +1,157 @@
+import argparse
+import itertools
+import json
+import os
+import pickle
+import time
+from types import SimpleNamespace
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+import retrain_model
+from retrain_model import (
+    NgramCounts,
+    build_binary_sections,
+    iter_corpus_chunks,
+    load_binary_model,
+    order_probabilities,
+)
+
+START_ID = 0
+
+
+class ModelUnpickler(pickle.Unpickler):
+    """Resolves TrigramLanguageModel whichever module the pickle was written from"""
+
+    def find_class(self, module, name):
+        if name == "TrigramLanguageModel":
+            return retrain_model.TrigramLanguageModel
+        return super().find_class(module, name)
+
+
+def load_model_sections(model_path):
+    """Model sections, lambdas and total token count from a binary model or a pickled TrigramLanguageModel"""
+    with open(model_path, "rb") as f:
+        is_binary = f.read(len(retrain_model.MODEL_MAGIC)) == retrain_model.MODEL_MAGIC
+    if is_binary:
+        sections, header = load_binary_model(model_path)
+        return sections, tuple(header["lambdas"]), header["total_tokens"]
+
+    with open(model_path, "rb") as f:
+        model = ModelUnpickler(f).load()
+    if isinstance(model, dict):
+        model = SimpleNamespace(**model)
+    counts = NgramCounts.from_model(model)
+    return build_binary_sections(counts), (model.lambda1, model.lambda2, model.lambda3), counts.total_tokens
+
+
+def _encode_chunk(texts):
+    return [retrain_model._worker_tokenizer.encode(text) for text in texts]
+
+
+def tokenize_csv(csv_path, tokenizer_path, chunk_rows, workers, column="content"):
+    """Tokenize every story of a CSV, in chunks spread over a process pool"""
+    chunks = iter_corpus_chunks(csv_path, chunk_rows, column)
+    if workers <= 1:
+        retrain_model._init_worker(tokenizer_path, START_ID)
+        return [ids for texts in chunks for ids in _encode_chunk(texts)]
+    with Pool(workers, initializer=retrain_model._init_worker, initargs=(tokenizer_path, START_ID)) as pool:
+        return [ids for encoded in pool.imap(_encode_chunk, chunks) for ids in encoded]
+
+
+def lambda_grid(step):
+    """All (lambda1, lambda2, lambda3) on a grid of the given step that sum to 1, with lambda1 > 0
+
+    lambda1 weights the unigram term, which is the only one that never gives a
+    token zero probability, so it is kept positive.
+    """
+    n = int(round(1 / step))
+    grid = []
+    for i, j in itertools.product(range(1, n + 1), range(n + 1)):
+        k = n - i - j
+        if k >= 0:
+            grid.append((i / n, j / n, k / n))
+    return grid
+
+
+def sweep_lambdas(orders, grid):
+    """Perplexity for every lambda triple, reusing the per-order arrays"""
+    return sorted(((orders.perplexity(lambdas), lambdas) for lambdas in grid), key=lambda item: item[0])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate a trained trigram model on held-out stories")
+    parser.add_argument("csv", help="Held-out stories CSV")
+    parser.add_argument("--column", default="content", help="Column holding the story text")
+    parser.add_argument("--model", default="Model/trigram_model.bin",
+                        help="Binary model or pickled TrigramLanguageModel (falls back to Model/trigram_model.pkl)")
+    parser.add_argument("--tokenizer", default="Tokenizer/bpe_tokenizer.pkl")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="Processes used for tokenizing")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Stories tokenized per task")
+    parser.add_argument("--sweep", type=float, default=0.0,
+                        help="Also sweep lambda1/lambda2/lambda3 on a grid with this step (e.g. 0.05)")
+    parser.add_argument("--top", type=int, default=10, help="Sweep results to print")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    model_path = args.model
+    if not os.path.exists(model_path) and model_path == "Model/trigram_model.bin":
+        model_path = "Model/trigram_model.pkl"
+
+    print(f"Loading model from {model_path}...")
+    sections, lambdas, total_tokens = load_model_sections(model_path)
+
+    print(f"Tokenizing {args.csv} with {args.workers} workers...")
+    start = time.perf_counter()
+    token_lists = tokenize_csv(args.csv, args.tokenizer, args.chunk_size, args.workers, args.column)
+    tokenize_seconds = time.perf_counter() - start
+    token_count = sum(len(tokens) for tokens in token_lists)
+
+    start = time.perf_counter()
+    orders = order_probabilities(sections, total_tokens, token_lists, START_ID)
+    log_probs = orders.log_probs(lambdas)
+    score_seconds = time.perf_counter() - start
+    perplexity = float(np.exp(-np.mean(log_probs))) if len(log_probs) else float("nan")
+
+    report = {
+        "model": model_path,
+        "csv": args.csv,
+        "stories": len(token_lists),
+        "tokens": token_count,
+        "scored_tokens": len(orders),
+        "oov_tokens": orders.oov,
+        "oov_rate": orders.oov / token_count if token_count else 0.0,
+        "lambdas": list(lambdas),
+        "perplexity": perplexity,
+        "bits_per_token": float(-np.mean(log_probs) / np.log(2)) if len(log_probs) else float("nan"),
+        "tokenize_tokens_per_s": token_count / tokenize_seconds if tokenize_seconds else None,
+        "score_tokens_per_s": len(orders) / score_seconds if score_seconds else None,
+    }
+    print(f"Stories: {report['stories']}, tokens: {token_count}, OOV: {orders.oov} ({report['oov_rate']:.3%})")
+    print(f"Perplexity with lambdas {lambdas}: {perplexity:.3f} ({report['bits_per_token']:.3f} bits/token)")
+    print(f"Throughput: tokenizing {report['tokenize_tokens_per_s']:.0f} tokens/s, "
+          f"scoring {report['score_tokens_per_s']:.0f} tokens/s")
+
+    if args.sweep > 0:
+        grid = lambda_grid(args.sweep)
+        start = time.perf_counter()
+        results = sweep_lambdas(orders, grid)
+        print(f"Swept {len(grid)} lambda settings in {time.perf_counter() - start:.2f}s")
+        print(f"{'lambda1':>8}{'lambda2':>9}{'lambda3':>9}{'perplexity':>12}")
+        for ppl, (l1, l2, l3) in results[:args.top]:
+            print(f"{l1:>8.2f}{l2:>9.2f}{l3:>9.2f}{ppl:>12.3f}")
+        report["sweep"] = [{"lambdas": list(l), "perplexity": ppl} for ppl, l in results]
+        report["best_lambdas"] = list(results[0][1])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,12 @@ import numpy as np
 import pickle
 import os
 import sys
-from collections import Counter, defaultdict
+import json
+import struct
+import hashlib
+import argparse
+from collections import Counter, defaultdict, deque
+from multiprocessing import Pool, cpu_count
 
 # Add the root directory to path to import tokenizer
 sys.path.append(os.getcwd())
@@ -29,33 +34,708 @@ class TrigramLanguageModel:
         self.total_tokens = 0
         self.vocab = set()
 
-    def train(self, corpus, start_id):
-        print("Training trigram model...")
-        for tokens in corpus:
-            # For trigram, we need two START tokens
-            full_tokens = [start_id, start_id] + tokens
-            self.total_tokens += len(full_tokens)
-
-            for i in range(len(full_tokens)):
-                w3 = full_tokens[i]
-                self.unigram[w3] += 1
-                self.vocab.add(w3)
-
-                if i >= 1:
-                    w2 = full_tokens[i-1]
-                    self.bigram[(w2, w3)] += 1
-                    self.unigram_totals[w2] += 1
-
-                if i >= 2:
-                    w1, w2 = full_tokens[i-2], full_tokens[i-1]
-                    self.trigram[(w1, w2, w3)] += 1
-                    self.bigram_totals[(w1, w2)] += 1
-        print(f"Trigram training completed. Vocab size: {len(self.vocab)}")
+    def load_counts(self, counts):
+        """Fill the Counters from packed NgramCounts (replaces any existing counts)"""
+        uni_keys, uni_counts = counts.unigram
+        bi_keys, bi_counts = counts.bigram
+        tri_keys, tri_counts = counts.trigram
+
+        self.unigram = Counter(dict(zip(uni_keys.tolist(), uni_counts.tolist())))
+        self.bigram = Counter(dict(zip(zip(*unpack_ids(bi_keys, 2)), bi_counts.tolist())))
+        self.trigram = Counter(dict(zip(zip(*unpack_ids(tri_keys, 3)), tri_counts.tolist())))
+
+        (uni_prefixes, uni_totals), (bi_prefixes, bi_totals) = counts.context_totals()
+        self.unigram_totals = Counter(dict(zip(uni_prefixes.tolist(), uni_totals.tolist())))
+        self.bigram_totals = Counter(dict(zip(zip(*unpack_ids(bi_prefixes, 2)), bi_totals.tolist())))
+
+        self.total_tokens = counts.total_tokens
+        self.vocab = set(self.unigram)
+        print(f"Trigram counts loaded. Vocab size: {len(self.vocab)}")
+
+
+# Token ids are packed into one int64 per n-gram, ID_BITS bits per id
+ID_BITS = 21
+ID_MASK = (1 << ID_BITS) - 1
+
+
+def unpack_ids(keys, order):
+    """Split packed n-gram keys into one list of ids per position"""
+    return [((keys >> (ID_BITS * (order - 1 - k))) & ID_MASK).tolist() for k in range(order)]
+
+
+def _group_sum(keys, counts):
+    """Sum counts per distinct key; keys need not be sorted or unique"""
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    totals = np.zeros(len(unique), dtype=np.int64)
+    np.add.at(totals, inverse, counts)
+    return unique, totals
+
+
+class NgramCounts:
+    """Unigram, bigram and trigram counts as sorted packed int64 keys with count arrays
+
+    totals optionally fixes the context totals N(w1, *) and N(w1, w2, *); pruned
+    counts keep the totals of the full counts so MLE denominators do not change.
+    """
+
+    def __init__(self, unigram=None, bigram=None, trigram=None, total_tokens=0, totals=None):
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        self.unigram = unigram if unigram is not None else empty
+        self.bigram = bigram if bigram is not None else empty
+        self.trigram = trigram if trigram is not None else empty
+        self.total_tokens = total_tokens
+        self.totals = totals
+
+    def context_totals(self):
+        """(packed w1 keys, N(w1, *)) and (packed (w1, w2) keys, N(w1, w2, *)), sorted by key"""
+        if self.totals is not None:
+            return self.totals
+        # The bigram and trigram counts grouped by their prefix
+        bi_keys, bi_counts = self.bigram
+        tri_keys, tri_counts = self.trigram
+        return _group_sum(bi_keys >> ID_BITS, bi_counts), _group_sum(tri_keys >> ID_BITS, tri_counts)
+
+    @classmethod
+    def from_tokens(cls, token_lists, start_id):
+        """Count n-grams of tokenized stories, each padded with two start ids"""
+        seqs = [np.asarray([start_id, start_id] + list(tokens), dtype=np.int64) for tokens in token_lists]
+        if not seqs:
+            return cls()
+        ids = np.concatenate(seqs)
+        lengths = np.array([len(seq) for seq in seqs])
+        # Position of every token inside its own story, so n-grams never span two stories
+        pos = np.arange(len(ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+        bi_keys = ((ids[:-1] << ID_BITS) | ids[1:])[pos[1:] >= 1]
+        tri_keys = ((ids[:-2] << (2 * ID_BITS)) | (ids[1:-1] << ID_BITS) | ids[2:])[pos[2:] >= 2]
+        return cls(
+            unigram=np.unique(ids, return_counts=True),
+            bigram=np.unique(bi_keys, return_counts=True),
+            trigram=np.unique(tri_keys, return_counts=True),
+            total_tokens=int(lengths.sum()),
+        )
+
+    @classmethod
+    def from_model(cls, model):
+        """Pack the Counters of a TrigramLanguageModel (e.g. an older pickle) back into arrays"""
+        def packed(counter, order):
+            if not counter:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+            keys = np.array(list(counter.keys()), dtype=np.int64).reshape(len(counter), order)
+            flat = np.zeros(len(counter), dtype=np.int64)
+            for k in range(order):
+                flat = (flat << ID_BITS) | keys[:, k]
+            values = np.fromiter(counter.values(), dtype=np.int64, count=len(counter))
+            order_idx = np.argsort(flat)
+            return flat[order_idx], values[order_idx]
+        return cls(
+            unigram=packed(model.unigram, 1),
+            bigram=packed(model.bigram, 2),
+            trigram=packed(model.trigram, 3),
+            total_tokens=int(model.total_tokens),
+            totals=(packed(model.unigram_totals, 1), packed(model.bigram_totals, 2)),
+        )
+
+    def merge(self, other):
+        """Return the sum of two sets of counts"""
+        return NgramCounts.merge_all([self, other])
+
+    @classmethod
+    def merge_all(cls, parts):
+        """Return the sum of any number of sets of counts, with one np.unique per order"""
+        def add(arrays):
+            return _group_sum(np.concatenate([a[0] for a in arrays]), np.concatenate([a[1] for a in arrays]))
+        parts = list(parts)
+        if not parts:
+            return cls()
+        return cls(
+            unigram=add([p.unigram for p in parts]),
+            bigram=add([p.bigram for p in parts]),
+            trigram=add([p.trigram for p in parts]),
+            total_tokens=sum(p.total_tokens for p in parts),
+        )
+
+
+def _lookup(keys, values, queries):
+    """values[i] where keys[i] == query (keys sorted), 0 where the query is missing"""
+    if len(keys) == 0:
+        return np.zeros(len(queries), dtype=np.float64)
+    idx = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+    return np.where(keys[idx] == queries, values[idx], 0).astype(np.float64)
+
+
+def _relative_entropy_scores(counts, lambdas):
+    """Per-entry pruning cost for bigrams and trigrams, after Stolcke's entropy-based pruning.
+
+    Each n-gram is scored by its share of the n-grams times the log ratio of its
+    interpolated probability with and without its own count. The interpolated
+    model is not renormalised, so this is an approximation of the exact
+    relative entropy, but it ranks entries the same way.
+    """
+    lambda1, lambda2, lambda3 = lambdas
+    uni_keys, uni_counts = counts.unigram
+    bi_keys, bi_counts = counts.bigram
+    tri_keys, tri_counts = counts.trigram
+    (uni_prefixes, uni_totals), (bi_prefixes, bi_totals) = counts.context_totals()
+    total = max(counts.total_tokens, 1)
+
+    # Bigram (w1, w): lower order is lambda1 * P(w)
+    p_uni = _lookup(uni_keys, uni_counts, bi_keys & ID_MASK) / total
+    p_bi = bi_counts / _lookup(uni_prefixes, uni_totals, bi_keys >> ID_BITS)
+    lower = lambda1 * p_uni
+    bigram_scores = bi_counts / max(bi_counts.sum(), 1) * np.log((lambda2 * p_bi + lower) / lower)
+
+    # Trigram (w1, w2, w): lower order is the interpolated bigram estimate
+    suffix = tri_keys & ((1 << (2 * ID_BITS)) - 1)
+    p_uni = _lookup(uni_keys, uni_counts, tri_keys & ID_MASK) / total
+    bi_total = _lookup(uni_prefixes, uni_totals, suffix >> ID_BITS)
+    p_bi = np.divide(_lookup(bi_keys, bi_counts, suffix), bi_total, out=np.zeros(len(suffix)), where=bi_total > 0)
+    p_tri = tri_counts / _lookup(bi_prefixes, bi_totals, tri_keys >> ID_BITS)
+    lower = lambda2 * p_bi + lambda1 * p_uni
+    trigram_scores = tri_counts / max(tri_counts.sum(), 1) * np.log((lambda3 * p_tri + lower) / lower)
+    return bigram_scores, trigram_scores
+
+
+def _top_k_mask(keys, counts, k):
+    """Mask keeping the k most frequent successors of every context (ties broken by id)"""
+    contexts = keys >> ID_BITS
+    order = np.lexsort((keys, -counts, contexts))
+    _, starts, sizes = np.unique(contexts[order], return_index=True, return_counts=True)
+    ranks = np.arange(len(keys)) - np.repeat(starts, sizes)
+    keep = np.zeros(len(keys), dtype=bool)
+    keep[order[ranks < k]] = True
+    return keep
+
+
+def prune_counts(counts, min_count=1, top_k=0, entropy_threshold=0.0, lambdas=(0.1, 0.3, 0.6)):
+    """Drop low-value bigram and trigram entries; unigrams and context totals are kept
+
+    min_count drops n-grams seen fewer times, entropy_threshold drops n-grams
+    whose pruning cost (see _relative_entropy_scores) is below it, and top_k
+    keeps at most that many successors per context.
+    """
+    masks = [np.ones(len(counts.bigram[0]), dtype=bool), np.ones(len(counts.trigram[0]), dtype=bool)]
+    if min_count > 1:
+        masks[0] &= counts.bigram[1] >= min_count
+        masks[1] &= counts.trigram[1] >= min_count
+    if entropy_threshold > 0:
+        for mask, scores in zip(masks, _relative_entropy_scores(counts, lambdas)):
+            mask &= scores >= entropy_threshold
+    if top_k > 0:
+        for mask, (keys, values) in zip(masks, (counts.bigram, counts.trigram)):
+            kept = np.nonzero(mask)[0]
+            mask[kept[~_top_k_mask(keys[kept], values[kept], top_k)]] = False
+
+    return NgramCounts(
+        unigram=counts.unigram,
+        bigram=(counts.bigram[0][masks[0]], counts.bigram[1][masks[0]]),
+        trigram=(counts.trigram[0][masks[1]], counts.trigram[1][masks[1]]),
+        total_tokens=counts.total_tokens,
+        totals=counts.context_totals(),
+    )
+
+
+# Each worker process loads the tokenizer once and then counts whole chunks of stories
+_worker_tokenizer = None
+_worker_start_id = 0
+
+
+def _init_worker(tokenizer_path, start_id):
+    global _worker_tokenizer, _worker_start_id
+    _worker_tokenizer = BPETokenizer.load(tokenizer_path)
+    _worker_start_id = start_id
+
+
+def _count_chunk(texts):
+    return NgramCounts.from_tokens([_worker_tokenizer.encode(text) for text in texts], _worker_start_id)
+
+
+def iter_corpus_chunks(corpus_path, chunk_rows, column='content'):
+    """Stream the story texts from the corpus CSV, chunk_rows rows at a time"""
+    for chunk in pd.read_csv(corpus_path, chunksize=chunk_rows):
+        texts = [str(text) for text in chunk[column].dropna().tolist()]
+        if texts:
+            yield texts
+
+
+def _push_shard(stack, shard):
+    """Add shard to a stack of (level, counts) partial sums, merging equal levels pairwise
+
+    Like a binary counter: two sums of 2**k shards are merged into one of
+    2**(k + 1), so every count takes part in O(log shards) merges instead of
+    one merge per shard.
+    """
+    level = 0
+    while stack and stack[-1][0] == level:
+        _, other = stack.pop()
+        shard = NgramCounts.merge_all([other, shard])
+        level += 1
+    stack.append((level, shard))
+
+
+def count_corpus(chunks, tokenizer_path, start_id, workers):
+    """Tokenize and count chunks of stories across a process pool and merge the shards"""
+    stack = []
+    stories = 0
+    if workers <= 1:
+        _init_worker(tokenizer_path, start_id)
+        for texts in chunks:
+            _push_shard(stack, _count_chunk(texts))
+            stories += len(texts)
+            print(f"Counted {stories} stories")
+        return NgramCounts.merge_all(counts for _, counts in stack)
+
+    with Pool(workers, initializer=_init_worker, initargs=(tokenizer_path, start_id)) as pool:
+        # Keep only a few chunks in flight so memory stays bounded by the chunk size
+        pending = deque()
+        for texts in chunks:
+            pending.append((len(texts), pool.apply_async(_count_chunk, (texts,))))
+            if len(pending) >= 2 * workers:
+                n, result = pending.popleft()
+                _push_shard(stack, result.get())
+                stories += n
+                print(f"Counted {stories} stories")
+        while pending:
+            n, result = pending.popleft()
+            _push_shard(stack, result.get())
+            stories += n
+            print(f"Counted {stories} stories")
+    # The remaining partial sums (at most log2(shards) + 1) are added with one final np.unique
+    return NgramCounts.merge_all(counts for _, counts in stack)
+
+
+def story_hash(text):
+    """16-byte content hash identifying a story across corpus exports"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def skip_ingested(chunks, seen, new_hashes):
+    """Pass chunks through minus stories whose hash is in seen or already passed; new hashes go to new_hashes"""
+    for texts in chunks:
+        fresh = []
+        for text in texts:
+            digest = story_hash(text)
+            if digest in seen or digest in new_hashes:
+                continue
+            new_hashes.add(digest)
+            fresh.append(text)
+        if fresh:
+            yield fresh
+
+
+def _hash_array(hashes):
+    # One row of 16 uint8 per hash; a bytes ("S16") array would drop trailing zero bytes
+    return np.frombuffer(b"".join(sorted(hashes)), dtype=np.uint8).reshape(-1, 16)
+
+
+# Full (unpruned) counts plus the hashes of the stories behind them, so --append
+# can add new stories without recounting the corpus
+def save_count_artifact(path, counts, story_hashes, heldout_hashes, tokenizer_digest, generation):
+    arrays = {
+        "unigram_keys": counts.unigram[0], "unigram_counts": counts.unigram[1],
+        "bigram_keys": counts.bigram[0], "bigram_counts": counts.bigram[1],
+        "trigram_keys": counts.trigram[0], "trigram_counts": counts.trigram[1],
+        "total_tokens": np.int64(counts.total_tokens),
+        "story_hashes": _hash_array(story_hashes),
+        "heldout_hashes": _hash_array(heldout_hashes),
+        "tokenizer_digest": np.array(tokenizer_digest),
+        "generation": np.int64(generation),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    print(f"Counts for {len(story_hashes)} stories written to {path}")
+
+
+def load_count_artifact(path):
+    """(counts, story hashes, held-out hashes, tokenizer digest, generation) from save_count_artifact"""
+    with np.load(path) as data:
+        counts = NgramCounts(
+            unigram=(data["unigram_keys"], data["unigram_counts"]),
+            bigram=(data["bigram_keys"], data["bigram_counts"]),
+            trigram=(data["trigram_keys"], data["trigram_counts"]),
+            total_tokens=int(data["total_tokens"]),
+        )
+        story_hashes = {row.tobytes() for row in data["story_hashes"]}
+        heldout_hashes = {row.tobytes() for row in data["heldout_hashes"]}
+        return counts, story_hashes, heldout_hashes, str(data["tokenizer_digest"]), int(data["generation"])
+
+# Binary model format read by TrigramModelLoader in the story service:
+# magic | version (u32) | header length (u32) | JSON header | 64-byte aligned arrays.
+# N-gram keys are vocab positions; successors are grouped by context in CSR form.
+MODEL_MAGIC = b"URTRIGRM"
+MODEL_FORMAT_VERSION = 1
+# Version 2 files may hold "<name>_codebook" sections that decode quantised counts
+QUANTIZED_FORMAT_VERSION = 2
+SECTION_ALIGNMENT = 64
+
+
+def _align(n):
+    return (n + SECTION_ALIGNMENT - 1) // SECTION_ALIGNMENT * SECTION_ALIGNMENT
+
+
+def build_binary_sections(counts):
+    """Convert packed n-gram counts into sorted CSR arrays over vocab positions"""
+    vocab, unigram_counts = counts.unigram
+    V = len(vocab)
+    (uni_prefixes, uni_totals), (bi_prefixes, bi_totals) = counts.context_totals()
+
+    unigram_totals = np.zeros(V, dtype=np.int64)
+    unigram_totals[np.searchsorted(vocab, uni_prefixes)] = uni_totals
+
+    # Packed keys sort by context then successor, and ids map to positions in
+    # the same order, so the counts are already in CSR order
+    bi_keys, bi_counts = counts.bigram
+    bi_rows = np.searchsorted(vocab, bi_keys >> ID_BITS)
+    bigram_indptr = np.searchsorted(bi_rows, np.arange(V + 1)).astype(np.int64)
+
+    tri_keys, tri_counts = counts.trigram
+    prefixes = tri_keys >> ID_BITS
+    tri_ctx = np.searchsorted(vocab, prefixes >> ID_BITS) * V + np.searchsorted(vocab, prefixes & ID_MASK)
+    contexts, starts = np.unique(tri_ctx, return_index=True)
+    context_totals = bi_totals[np.searchsorted(bi_prefixes, prefixes[starts])]
+
+    return {
+        "vocab": vocab.astype(np.int32),
+        "unigram_counts": unigram_counts.astype(np.int64),
+        "unigram_totals": unigram_totals,
+        "bigram_indptr": bigram_indptr,
+        "bigram_next": np.searchsorted(vocab, bi_keys & ID_MASK).astype(np.int32),
+        "bigram_counts": bi_counts.astype(np.int64),
+        "trigram_context": contexts.astype(np.int64),
+        "trigram_context_totals": context_totals.astype(np.int64),
+        "trigram_indptr": np.append(starts, len(tri_keys)).astype(np.int64),
+        "trigram_next": np.searchsorted(vocab, tri_keys & ID_MASK).astype(np.int32),
+        "trigram_counts": tri_counts.astype(np.int64),
+    }
+
+
+# How the bigram and trigram count sections can be stored. Totals always stay int64.
+COUNT_STORAGE = ("int64", "uint32", "uint16", "logcount8")
+CODEBOOK_SIZE = 256
+
+
+def _log_codebook(counts):
+    """Up to 256 count levels: the smallest distinct counts exactly, the rest log-spaced"""
+    distinct = np.unique(counts)
+    if len(distinct) <= CODEBOOK_SIZE:
+        return distinct.astype(np.float64)
+    exact = distinct[:CODEBOOK_SIZE // 2].astype(np.float64)
+    edges = np.geomspace(exact[-1], distinct[-1], CODEBOOK_SIZE // 2 + 1)
+    # Geometric midpoints of each log-spaced bin
+    return np.concatenate([exact, np.sqrt(edges[:-1] * edges[1:])])
+
+
+def quantize_counts(counts):
+    """uint8 codes and a float64 codebook; each count maps to the level nearest in log space"""
+    codebook = _log_codebook(counts)
+    log_levels = np.log(codebook)
+    # Midpoints between neighbouring levels in log space decide which code a count gets
+    bounds = (log_levels[:-1] + log_levels[1:]) / 2
+    codes = np.searchsorted(bounds, np.log(np.maximum(counts, 1))).astype(np.uint8)
+    return codes, codebook
+
+
+def apply_count_storage(sections, storage):
+    """Narrow or quantise the bigram and trigram count sections in place"""
+    if storage not in COUNT_STORAGE:
+        raise ValueError(f"Unknown count storage {storage!r}, expected one of {COUNT_STORAGE}")
+    for name in ("bigram_counts", "trigram_counts"):
+        counts = sections[name]
+        if storage == "logcount8":
+            sections[name], sections[name + "_codebook"] = quantize_counts(counts)
+        elif storage != "int64":
+            limit = np.iinfo(storage).max
+            clipped = int((counts > limit).sum())
+            if clipped:
+                print(f"Warning: {clipped} {name} exceed {storage} and were clipped to {limit}")
+            sections[name] = np.minimum(counts, limit).astype(storage)
+    return sections
+
+
+def decoded_counts(sections, name):
+    """A count section as float64, decoding it through its codebook if it was quantised"""
+    codebook = sections.get(name + "_codebook")
+    if codebook is not None:
+        return codebook[sections[name]]
+    return sections[name].astype(np.float64)
+
+
+def sections_nbytes(sections):
+    return sum(arr.nbytes for arr in sections.values())
+
+
+class OrderProbabilities:
+    """MLE estimates of each order for every scored token, kept apart so any lambdas apply cheaply
+
+    tri/bi/uni hold P_MLE(w | context) per token (0 where the order has no
+    row for the context); the *_mass arrays hold the MLE mass left in each
+    token's context rows, which is below 1 after pruning and normalises the
+    mixture the same way the sampler does.
+    """
+
+    def __init__(self, tri, bi, uni, tri_mass, bi_mass, uni_mass, vocab_size, oov=0):
+        self.tri, self.bi, self.uni = tri, bi, uni
+        self.tri_mass, self.bi_mass, self.uni_mass = tri_mass, bi_mass, uni_mass
+        self.vocab_size = vocab_size
+        self.oov = oov
+
+    def __len__(self):
+        return len(self.uni)
+
+    def log_probs(self, lambdas):
+        """Natural-log probability of every scored token under the given (lambda1, lambda2, lambda3)"""
+        lambda1, lambda2, lambda3 = lambdas
+        prob = lambda3 * self.tri + lambda2 * self.bi + lambda1 * self.uni
+        norm = lambda3 * self.tri_mass + lambda2 * self.bi_mass + lambda1 * self.uni_mass
+        valid = norm > 0
+        prob = np.where(valid, prob / np.where(valid, norm, 1), 1.0 / self.vocab_size)
+        with np.errstate(divide="ignore"):
+            return np.log(prob)
+
+    def perplexity(self, lambdas):
+        if len(self) == 0:
+            return float("nan")
+        return float(np.exp(-np.mean(self.log_probs(lambdas))))
+
+
+def order_probabilities(sections, total_tokens, token_lists, start_id):
+    """Look up the per-order estimates of every token of tokenized stories in model sections
+
+    Every n-gram is found with sorted-array searches, so scoring is a few
+    passes over the token array. Contexts are padded with two start ids, as in
+    training; tokens missing from the model vocabulary are counted as OOV and
+    not scored.
+    """
+    vocab = sections["vocab"].astype(np.int64)
+    V = len(vocab)
+    seqs = [np.asarray([start_id, start_id] + list(tokens), dtype=np.int64) for tokens in token_lists if len(tokens)]
+    empty = np.zeros(0, dtype=np.float64)
+    if not seqs or V == 0:
+        return OrderProbabilities(empty, empty, empty, empty, empty, empty, max(V, 1))
+    ids = np.concatenate(seqs)
+    lengths = np.array([len(seq) for seq in seqs])
+    pos = np.arange(len(ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    positions = np.minimum(np.searchsorted(vocab, ids), V - 1)
+    positions = np.where(vocab[positions] == ids, positions, -1)
+    targets = np.nonzero(pos >= 2)[0]
+    w, w1, w2 = positions[targets], positions[targets - 1], positions[targets - 2]
+    oov = w < 0
+    w, w1, w2 = w[~oov], w1[~oov], w2[~oov]
+
+    unigram_counts = sections["unigram_counts"].astype(np.float64)
+    uni_totals = sections["unigram_totals"]
+    bi_counts = decoded_counts(sections, "bigram_counts")
+    tri_counts = decoded_counts(sections, "trigram_counts")
+    bi_indptr, tri_indptr = sections["bigram_indptr"], sections["trigram_indptr"]
+    tri_ctx, tri_totals = sections["trigram_context"], sections["trigram_context_totals"]
+
+    def row_sums(counts, indptr):
+        cumulative = np.concatenate([[0.0], np.cumsum(counts)])
+        return cumulative[indptr[1:]] - cumulative[indptr[:-1]]
+
+    def entry_keys(indptr, successors):
+        # Row * V + successor is sorted, since rows are in order and successors sorted within a row
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        return rows * V + successors
+
+    # Trigram term, only for contexts with a trigram row
+    ctx_keys = np.where((w2 >= 0) & (w1 >= 0), w2 * V + w1, -1)
+    rows = np.minimum(np.searchsorted(tri_ctx, ctx_keys), max(len(tri_ctx) - 1, 0))
+    has_tri = (ctx_keys >= 0) & (len(tri_ctx) > 0)
+    if len(tri_ctx):
+        has_tri &= (tri_ctx[rows] == ctx_keys) & (tri_totals[rows] > 0)
+    tri_total = np.where(has_tri, tri_totals[rows] if len(tri_ctx) else 0, 1)
+    tri_count = np.where(has_tri, _lookup(entry_keys(tri_indptr, sections["trigram_next"]), tri_counts, rows * V + w), 0)
+    tri_mass = np.where(has_tri, row_sums(tri_counts, tri_indptr)[rows] if len(tri_ctx) else 0, 0)
+
+    # Bigram term, for contexts whose previous token has successors
+    safe_w1 = np.maximum(w1, 0)
+    has_bi = (w1 >= 0) & (uni_totals[safe_w1] > 0)
+    bi_total = np.where(has_bi, uni_totals[safe_w1], 1)
+    bi_count = np.where(has_bi, _lookup(entry_keys(bi_indptr, sections["bigram_next"]), bi_counts, safe_w1 * V + w), 0)
+    bi_mass = np.where(has_bi, row_sums(bi_counts, bi_indptr)[safe_w1], 0)
+
+    return OrderProbabilities(
+        tri=tri_count / tri_total,
+        bi=bi_count / bi_total,
+        uni=unigram_counts[w] / total_tokens,
+        tri_mass=tri_mass / tri_total,
+        bi_mass=bi_mass / bi_total,
+        uni_mass=np.full(len(w), unigram_counts.sum() / total_tokens),
+        vocab_size=V,
+        oov=int(oov.sum()),
+    )
+
+
+def heldout_perplexity(sections, lambdas, total_tokens, token_lists, start_id):
+    """Perplexity of tokenized stories under the normalised interpolated model the service samples from
+
+    Returns (perplexity, predicted tokens, skipped out-of-vocabulary tokens).
+    """
+    orders = order_probabilities(sections, total_tokens, token_lists, start_id)
+    return orders.perplexity(lambdas), len(orders), orders.oov
+
+
+def special_token_ids(tokenizer, start_id):
+    """Ids recorded in the binary header for the start padding and the EOS/EOP/EOT markers
+
+    A marker's id is only known (else -1) if the tokenizer learned it as a single token.
+    """
+    special_ids = {"start": start_id}
+    for name, char in (("eos", "\uFFF0"), ("eop", "\uFFF1"), ("eot", "\uFFF2")):
+        special_ids[name] = tokenizer.vocab.get(char.encode("utf-8"), -1)
+    return special_ids
+
+
+def export_binary_model(sections, lambdas, total_tokens, output_path, special_ids, metadata=None):
+    """Write model sections in the versioned, memory-mappable binary format
+
+    metadata is stored in the header as is (e.g. the training generation).
+    """
+    quantized = any(name.endswith("_codebook") for name in sections)
+    version = QUANTIZED_FORMAT_VERSION if quantized else MODEL_FORMAT_VERSION
+
+    layout = {}
+    offset = 0
+    for name, arr in sections.items():
+        layout[name] = {"offset": offset, "dtype": arr.dtype.str, "shape": list(arr.shape)}
+        offset = _align(offset + arr.nbytes)
+
+    header = {
+        "lambdas": list(lambdas),
+        "total_tokens": int(total_tokens),
+        "special_ids": special_ids,
+        "sections": layout,
+    }
+    if metadata:
+        header["metadata"] = metadata
+    # Content hash computed here, so the service can use it as the model version without re-reading the file
+    digest = hashlib.sha256(json.dumps(header, sort_keys=True).encode("utf-8"))
+    for arr in sections.values():
+        digest.update(np.ascontiguousarray(arr).tobytes())
+    header["content_sha256"] = digest.hexdigest()
+    # The data offset depends on the header length, which in turn contains it,
+    # so reserve enough digits for it before serialising
+    header["data_offset"] = 0
+    header_len = len(json.dumps(header).encode("utf-8")) + 20
+    header["data_offset"] = _align(len(MODEL_MAGIC) + 8 + header_len)
+    header_bytes = json.dumps(header).encode("utf-8").ljust(header_len)
+
+    # Write to a temporary file and rename it into place, so a running service that
+    # has the old file memory-mapped keeps reading the old data until it reloads
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MODEL_MAGIC)
+        f.write(struct.pack("<II", version, len(header_bytes)))
+        f.write(header_bytes)
+        for name, arr in sections.items():
+            f.seek(header["data_offset"] + layout[name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp_path, output_path)
+    print(f"Binary model written to {output_path} ({os.path.getsize(output_path)} bytes)")
+
+
+def load_binary_model(path):
+    """Read a binary model back as (sections, header); sections are read-only memory maps"""
+    with open(path, "rb") as f:
+        if f.read(len(MODEL_MAGIC)) != MODEL_MAGIC:
+            raise ValueError(f"{path} is not a binary trigram model")
+        version, header_len = struct.unpack("<II", f.read(8))
+        if version not in (MODEL_FORMAT_VERSION, QUANTIZED_FORMAT_VERSION):
+            raise ValueError(f"Unsupported model format version {version}")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+    sections = {}
+    for name, meta in header["sections"].items():
+        dtype = np.dtype(meta["dtype"])
+        offset = header["data_offset"] + meta["offset"]
+        nbytes = int(np.prod(meta["shape"], dtype=np.int64)) * dtype.itemsize
+        sections[name] = buf[offset:offset + nbytes].view(dtype).reshape(meta["shape"])
+    return sections, header
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the trigram model on the processed corpus")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="Processes used for tokenizing and counting")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Stories read and counted per task")
+    parser.add_argument("--min-count", type=int, default=1, help="Drop bigrams and trigrams seen fewer times")
+    parser.add_argument("--top-k", type=int, default=0, help="Keep at most this many successors per context (0: all)")
+    parser.add_argument("--prune-entropy", type=float, default=0.0,
+                        help="Drop bigrams and trigrams whose relative-entropy pruning cost is below this (e.g. 1e-8)")
+    parser.add_argument("--count-storage", choices=COUNT_STORAGE, default="int64",
+                        help="Storage for bigram/trigram counts in the binary model")
+    parser.add_argument("--heldout", type=float, default=0.0,
+                        help="Fraction of stories held out to report size against perplexity (e.g. 0.02)")
+    parser.add_argument("--append", action="store_true",
+                        help="Add only stories not yet counted to the saved counts instead of recounting the corpus")
+    return parser.parse_args()
+
+
+def split_heldout(chunks, fraction, heldout_texts):
+    """Pass chunks through minus every round(1 / fraction)-th story, which goes to heldout_texts"""
+    every = max(int(round(1 / fraction)), 2)
+    seen = 0
+    for texts in chunks:
+        train = []
+        for text in texts:
+            (heldout_texts if seen % every == every - 1 else train).append(text)
+            seen += 1
+        if train:
+            yield train
+
+
+def pruning_report(full_counts, counts, sections, storage, lambdas, heldout_tokens, start_id):
+    """Compare entry counts, binary size and held-out perplexity of the full and pruned/stored model"""
+    rows = {}
+    variants = [("full", full_counts, build_binary_sections(full_counts)), ("pruned", counts, sections)]
+    for name, variant_counts, variant_sections in variants:
+        perplexity, predicted, oov = heldout_perplexity(variant_sections, lambdas, variant_counts.total_tokens,
+                                                        heldout_tokens, start_id)
+        rows[name] = {
+            "bigrams": int(len(variant_counts.bigram[0])),
+            "trigrams": int(len(variant_counts.trigram[0])),
+            "bytes": int(sections_nbytes(variant_sections)),
+            "heldout_perplexity": perplexity,
+        }
+    full, pruned = rows["full"], rows["pruned"]
+    report = {
+        "count_storage": storage,
+        "heldout_tokens": predicted,
+        "heldout_oov": oov,
+        "full": full,
+        "pruned": pruned,
+        "size_ratio": pruned["bytes"] / full["bytes"] if full["bytes"] else None,
+        "perplexity_change": pruned["heldout_perplexity"] / full["heldout_perplexity"] - 1,
+    }
+    print(f"{'':8}{'bigrams':>12}{'trigrams':>12}{'bytes':>14}{'perplexity':>12}")
+    for name, row in rows.items():
+        print(f"{name:8}{row['bigrams']:>12}{row['trigrams']:>12}{row['bytes']:>14}{row['heldout_perplexity']:>12.3f}")
+    print(f"Size: {report['size_ratio']:.1%} of full, perplexity {report['perplexity_change']:+.2%} "
+          f"on {predicted} held-out tokens ({oov} OOV skipped)")
+    return report
+
 
 def main():
+    args = parse_args()
     tokenizer_path = "Tokenizer/bpe_tokenizer.pkl"
     corpus_path = "PreProcessing/urdu_stories_processed.csv"
     model_output_path = "Model/trigram_model.pkl"
+    binary_output_path = "Model/trigram_model.bin"
+    report_output_path = "Model/pruning_report.json"
+    counts_path = "Model/trigram_counts.npz"
 
     if not os.path.exists(tokenizer_path):
         print(f"Error: Tokenizer not found at {tokenizer_path}")
@@ -63,17 +743,6 @@ def main():
 
     print("Loading tokenizer...")
     tokenizer = BPETokenizer.load(tokenizer_path)
-    
-    print("Loading corpus...")
-    df = pd.read_csv(corpus_path)
-    texts = df['content'].dropna().tolist()
-    
-    print("Tokenizing corpus...")
-    tokenized_corpus = []
-    for i, text in enumerate(texts):
-        tokenized_corpus.append(tokenizer.encode(str(text)))
-        if (i+1) % 200 == 0:
-            print(f"Tokenized {i+1} stories")
 
     # Byte-level BPE typically doesn't have a reserved START token unless we add one.
     # However, for consistency with the service loader, we'll use a specific ID.
@@ -83,9 +752,50 @@ def main():
     # But current loader uses integer IDs. 
     # Let's use 0 because it's already used in model_loader context.
     start_id = 0 
-    
+
+    tokenizer_digest = file_digest(tokenizer_path)
+    base_counts, story_hashes, heldout_hashes, generation = None, set(), set(), 0
+    if args.append:
+        if not os.path.exists(counts_path):
+            print(f"Error: --append needs the counts of a previous run at {counts_path}")
+            return
+        base_counts, story_hashes, heldout_hashes, counted_with, generation = load_count_artifact(counts_path)
+        # Counts are per token id, so they cannot be extended with a different tokenizer
+        if counted_with != tokenizer_digest:
+            print(f"Error: {counts_path} was counted with a different tokenizer; retrain without --append")
+            return
+        print(f"Loaded counts for {len(story_hashes)} stories (generation {generation})")
+
+    # Duplicate rows are counted once, so appending batches gives the same counts as one full run
+    new_hashes = set()
+    chunks = skip_ingested(iter_corpus_chunks(corpus_path, args.chunk_size), story_hashes | heldout_hashes, new_hashes)
+    heldout_texts = []
+    if args.heldout > 0:
+        chunks = split_heldout(chunks, args.heldout, heldout_texts)
+
+    print(f"Tokenizing and counting {'new stories' if args.append else 'corpus'} with {args.workers} workers...")
+    full_counts = count_corpus(chunks, tokenizer_path, start_id, args.workers)
+    new_heldout = {story_hash(text) for text in heldout_texts}
+    added = new_hashes - new_heldout
+    if args.append:
+        if not added:
+            print("No new stories to add; model left unchanged")
+            return
+        full_counts = base_counts.merge(full_counts)
+    story_hashes |= added
+    heldout_hashes |= new_heldout
+    generation += 1
+    print(f"Added {len(added)} stories, {len(story_hashes)} in total")
+    save_count_artifact(counts_path, full_counts, story_hashes, heldout_hashes, tokenizer_digest, generation)
+
     model = TrigramLanguageModel()
-    model.train(tokenized_corpus, start_id)
+    lambdas = (model.lambda1, model.lambda2, model.lambda3)
+    counts = full_counts
+    if args.min_count > 1 or args.top_k > 0 or args.prune_entropy > 0:
+        counts = prune_counts(full_counts, args.min_count, args.top_k, args.prune_entropy, lambdas)
+        print(f"Pruned to {len(counts.bigram[0])}/{len(full_counts.bigram[0])} bigrams "
+              f"and {len(counts.trigram[0])}/{len(full_counts.trigram[0])} trigrams")
+    model.load_counts(counts)
     
     print(f"Saving model to {model_output_path}...")
     with open(model_output_path, 'wb') as f:
@@ -93,5 +803,18 @@ def main():
     
     print(f"Model saved successfully.")
 
+    special_ids = special_token_ids(tokenizer, start_id)
+    sections = apply_count_storage(build_binary_sections(counts), args.count_storage)
+    metadata = {"generation": generation, "stories": len(story_hashes), "tokenizer_sha256": tokenizer_digest}
+    export_binary_model(sections, lambdas, counts.total_tokens, binary_output_path, special_ids, metadata)
+
+    if heldout_texts:
+        print(f"Evaluating on {len(heldout_texts)} held-out stories...")
+        heldout_tokens = [tokenizer.encode(text) for text in heldout_texts]
+        report = pruning_report(full_counts, counts, sections, args.count_storage, lambdas, heldout_tokens, start_id)
+        with open(report_output_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {report_output_path}")
+
 if __name__ == "__main__":
     main()
@@ -27,7 +27,7 @@ def train_tokenizer():
     print(f"Training Byte-level BPE Tokenizer with vocab_size={vocab_size}...")
     
     tokenizer = BPETokenizer(vocab_size=vocab_size)
-    tokenizer.train(full_text)
+    tokenizer.train(full_text, incremental=True)
     
     output_path = "Tokenizer/bpe_tokenizer.pkl"
     tokenizer.save(output_path)
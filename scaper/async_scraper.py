@@ -0,0 +1,311 @@
+"""Concurrent scraper for the urdupoint.com kids story categories.
+
+Fetches listing pages and stories as static HTML over one pooled async HTTP
+client instead of driving a browser, into the shared StoryStore:
+
+    python async_scraper.py --category moral --category funny --concurrency 8 --rate 4
+    python converter.py
+
+Re-running skips listing pages already completed and stories already stored.
+
+--url-template points the scraper at another server (e.g. a local stub
+serving fixture pages) so it can be exercised offline; check_async_scraper.py
+runs it against the pages in fixtures/ through an httpx.MockTransport stub.
+"""
+import argparse
+import asyncio
+import random
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+from story_store import StoryStore
+
+# -------- Categories: listing URL template and number of listing pages --------
+CATEGORIES = {
+    "moral": ("https://www.urdupoint.com/kids/category/moral-stories-page{}.html", 149),
+    "funny": ("https://www.urdupoint.com/kids/category/funny-stories-page{}.html", 11),
+}
+
+CONTINUED_MARKER = "(جاری ہے)"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+USER_AGENT = "Mozilla/5.0 (compatible; urdu-story-corpus/1.0)"
+
+# Elements that end a line in the rendered text, like a browser's innerText
+BLOCK_TAGS = {"p", "div", "br", "h1", "h2", "h3", "h4", "h5", "h6", "li", "tr", "section", "article", "blockquote"}
+VOID_TAGS = {"br", "img", "hr", "meta", "link", "input", "source", "wbr", "area", "base", "col", "embed", "param", "track"}
+SKIP_TAGS = {"script", "style", "noscript", "template"}
+
+
+# -------- HTML parsing --------
+def _matches(tag, attrs, selector):
+    """selector is (tag or None, class or None), e.g. ("p", "txt_red") for p.txt_red"""
+    want_tag, want_class = selector
+    if want_tag and tag != want_tag:
+        return False
+    if want_class:
+        classes = (dict(attrs).get("class") or "").split()
+        return want_class in classes
+    return True
+
+
+class _SelectorParser(HTMLParser):
+    """Collects the text of the first element matching each selector and the hrefs of link_class anchors"""
+
+    def __init__(self, selectors=None, link_class=None):
+        super().__init__(convert_charrefs=True)
+        self.selectors = selectors or {}
+        self.link_class = link_class
+        self.links = []
+        self.texts = {}
+        self._open = []  # [name, depth at which the element opened, text parts]
+        self._depth = 0
+        self._skip_depth = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.link_class and tag == "a" and _matches(tag, attrs, (None, self.link_class)):
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+        if tag in VOID_TAGS:
+            if tag == "br":
+                self._text("\n")
+            return
+        self._depth += 1
+        if tag in SKIP_TAGS and self._skip_depth is None:
+            self._skip_depth = self._depth
+        if tag in BLOCK_TAGS:
+            self._text("\n")
+        for name, selector in self.selectors.items():
+            if name not in self.texts and not any(o[0] == name for o in self._open) and _matches(tag, attrs, selector):
+                self._open.append([name, self._depth, []])
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if tag in BLOCK_TAGS:
+            self._text("\n")
+        if self._skip_depth == self._depth:
+            self._skip_depth = None
+        still_open = []
+        for name, depth, parts in self._open:
+            if depth == self._depth:
+                self.texts[name] = _clean_text("".join(parts))
+            else:
+                still_open.append([name, depth, parts])
+        self._open = still_open
+        self._depth = max(self._depth - 1, 0)
+
+    def handle_data(self, data):
+        if self._skip_depth is None:
+            self._text(data)
+
+    def _text(self, text):
+        for _, _, parts in self._open:
+            parts.append(text)
+
+    def close(self):
+        super().close()
+        # Elements left open by malformed HTML still yield their text
+        for name, _, parts in self._open:
+            self.texts.setdefault(name, _clean_text("".join(parts)))
+        self._open = []
+
+
+def _clean_text(text):
+    """Collapse whitespace within lines and drop blank lines"""
+    lines = (" ".join(line.split()) for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+STORY_SELECTORS = {
+    "title": ("h2", "urdu"),
+    "subtitle": ("p", "txt_red"),
+    "date": ("p", "art_info_bar"),
+    "content": (None, "txt_detail"),
+}
+
+
+def parse_listing(html, page_url):
+    """Absolute story URLs of the sharp_box links on a listing page, in page order"""
+    parser = _SelectorParser(link_class="sharp_box")
+    parser.feed(html)
+    parser.close()
+    links = []
+    for href in parser.links:
+        url = urljoin(page_url, href)
+        if url not in links:
+            links.append(url)
+    return links
+
+
+def parse_story(html, url):
+    """Story record with the same fields the Selenium scrapers produced, or None without a txt_detail body"""
+    parser = _SelectorParser(selectors=STORY_SELECTORS)
+    parser.feed(html)
+    parser.close()
+    if "content" not in parser.texts:
+        return None
+    story = {name: parser.texts.get(name, "") for name in STORY_SELECTORS}
+    story["content"] = story["content"].replace(CONTINUED_MARKER, "").strip()
+    story["url"] = url
+    return story
+
+
+# -------- Fetching --------
+class HostRateLimiter:
+    """Spaces requests to each host at least 1 / rate seconds apart"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = {}
+
+    async def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # Reserve the next free slot before sleeping, so concurrent callers queue up behind it
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Fetcher:
+    """GETs pages through a shared client with a concurrency cap, per-host rate limit and retries"""
+
+    def __init__(self, client, concurrency=8, rate=2.0, retries=4, backoff=1.0):
+        self.client = client
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = HostRateLimiter(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.requests = 0
+        self.failures = 0
+
+    async def get(self, url):
+        """Page text, or None if it is missing or still failing after the retries"""
+        for attempt in range(self.retries + 1):
+            delay = None
+            async with self.semaphore:
+                await self.limiter.wait(url)
+                self.requests += 1
+                try:
+                    response = await self.client.get(url)
+                except httpx.TransportError as e:
+                    error = f"{type(e).__name__}: {e}"
+                else:
+                    if response.status_code == 200:
+                        return response.text
+                    if response.status_code not in RETRY_STATUSES:
+                        print(f"Skipping {url}: HTTP {response.status_code}")
+                        self.failures += 1
+                        return None
+                    error = f"HTTP {response.status_code}"
+                    retry_after = response.headers.get("Retry-After", "")
+                    delay = float(retry_after) if retry_after.isdigit() else None
+            if attempt < self.retries:
+                # Exponential backoff with jitter, outside the semaphore so other requests proceed
+                delay = delay if delay is not None else self.backoff * 2 ** attempt * (0.5 + random.random())
+                print(f"Retrying {url} in {delay:.1f}s ({error})")
+                await asyncio.sleep(delay)
+        print(f"Giving up on {url} ({error})")
+        self.failures += 1
+        return None
+
+
+# -------- Scraping --------
+async def scrape_page(fetcher, page_url, claimed, stored=()):
+    """(stories, complete) for one listing page, in link order, skipping URLs claimed or stored already
+
+    complete is False if the listing or one of its stories could not be fetched,
+    so the page is tried again on the next run.
+    """
+    html = await fetcher.get(page_url)
+    if html is None:
+        return [], False
+    links = [link for link in parse_listing(html, page_url) if link not in claimed and link not in stored]
+    claimed.update(links)
+    pages = await asyncio.gather(*(fetcher.get(link) for link in links))
+    stories = []
+    for link, story_html in zip(links, pages):
+        story = parse_story(story_html, link) if story_html is not None else None
+        if story is None:
+            print(f"Story content not found, skipping {link}")
+            continue
+        stories.append(story)
+    return stories, all(story_html is not None for story_html in pages)
+
+
+async def scrape(page_urls, store, concurrency=8, rate=2.0, retries=4, backoff=1.0, timeout=30.0, transport=None):
+    """Scrape the listing pages not yet completed in store concurrently; returns the number of new stories
+
+    Each page's stories are written to the store as soon as the page finishes.
+    transport is passed to httpx.AsyncClient, e.g. an httpx.MockTransport for tests.
+    """
+    pending = [url for url in page_urls if not store.page_done(url)]
+    if len(pending) < len(page_urls):
+        print(f"Resuming: {len(page_urls) - len(pending)} pages already completed, {len(store)} stories stored")
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True,
+                                 headers={"User-Agent": USER_AGENT}, transport=transport) as client:
+        fetcher = Fetcher(client, concurrency, rate, retries, backoff)
+        claimed = set()
+
+        async def page_task(url):
+            stories, complete = await scrape_page(fetcher, url, claimed, store)
+            if complete:
+                added = store.complete_page(url, stories)
+            else:
+                added = store.add_stories(stories, url)
+            print(f"{url}: {added} new stories{'' if complete else ' (incomplete, retried next run)'}")
+            return added
+
+        added = sum(await asyncio.gather(*(page_task(url) for url in pending)))
+
+    print(f"{fetcher.requests} requests, {fetcher.failures} failed")
+    return added
+
+
+def listing_urls(args):
+    if args.url_template:
+        return [args.url_template.format(page) for page in range(args.first_page, (args.last_page or 1) + 1)]
+    urls = []
+    for category in args.category or ["moral"]:
+        template, last_page = CATEGORIES[category]
+        urls.extend(template.format(page) for page in range(args.first_page, (args.last_page or last_page) + 1))
+    return urls
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape Urdu kids stories concurrently over HTTP")
+    parser.add_argument("--category", action="append", choices=sorted(CATEGORIES),
+                        help="Story category to scrape; repeat for several (default: moral)")
+    parser.add_argument("--url-template", help="Listing page URL with {} for the page number, instead of --category")
+    parser.add_argument("--first-page", type=int, default=1)
+    parser.add_argument("--last-page", type=int, help="Last listing page (default: the category's last page)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--rate", type=float, default=2.0, help="Requests per second per host (0: unlimited)")
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--backoff", type=float, default=1.0, help="First retry delay in seconds, doubled per retry")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--store", default="stories.sqlite", help="Story store to add to and resume from")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    urls = listing_urls(args)
+    print(f"Scraping {len(urls)} listing pages with concurrency {args.concurrency}...")
+    start = time.perf_counter()
+    with StoryStore(args.store) as store:
+        added = asyncio.run(scrape(urls, store, args.concurrency, args.rate, args.retries, args.backoff, args.timeout))
+        print(f"\n✅ {added} new stories, {len(store)} in {args.store} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Offline check of async_scraper.py against the fixture pages in fixtures/.
+
+    python check_async_scraper.py
+
+Serves the fixtures through an httpx.MockTransport stub (one listing page
+links a story twice, both pages share a story, one story answers 404 and one
+answers 503 once) and checks the 404 skip, the 503 retry, link
+deduplication, script/style stripping and resuming from the store.
+"""
+import asyncio
+import os
+import tempfile
+from collections import Counter
+
+import httpx
+
+from async_scraper import scrape
+from story_store import StoryStore
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+BASE_URL = "https://stub.test/kids/category/moral-stories-page{}.html"
+PAGES = [BASE_URL.format(page) for page in (1, 2)]
+
+
+class StubServer:
+    """Serves fixtures/<file name of the URL path>; story-flaky answers 503 the first time"""
+
+    def __init__(self):
+        self.requests = Counter()
+
+    def __call__(self, request):
+        name = os.path.basename(request.url.path)
+        self.requests[name] += 1
+        if name == "story-flaky.html" and self.requests[name] == 1:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        path = os.path.join(FIXTURES, name)
+        if not os.path.exists(path):
+            return httpx.Response(404)
+        with open(path, "r", encoding="utf-8") as f:
+            return httpx.Response(200, text=f.read(), headers={"Content-Type": "text/html; charset=utf-8"})
+
+
+def run(store, server):
+    return asyncio.run(scrape(PAGES, store, rate=0, retries=2, backoff=0, transport=httpx.MockTransport(server)))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        store_path = os.path.join(tmp, "stories.sqlite")
+
+        # -------- First run --------
+        server = StubServer()
+        with StoryStore(store_path, legacy_json=None) as store:
+            added = run(store, server)
+            stories = {os.path.basename(story["url"]): story for story in store.iter_stories()}
+            assert added == 4, added
+            assert sorted(stories) == ["story-1.html", "story-2.html", "story-3.html", "story-flaky.html"], sorted(stories)
+            # Linked twice on page 1 and again on page 2, fetched once
+            assert server.requests["story-1.html"] == 1 and server.requests["story-2.html"] == 1, server.requests
+            # 503 retried, 404 skipped without a retry
+            assert server.requests["story-flaky.html"] == 2, server.requests
+            assert server.requests["story-missing.html"] == 1, server.requests
+            assert server.requests["not-a-story.html"] == 0, server.requests
+            # Script and style text and the "continued" marker are stripped
+            story = stories["story-1.html"]
+            assert story["title"] == "پیاسا کوا" and story["subtitle"] == "محنت کا پھل", story
+            assert story["content"] == "ایک دن ایک کوا بہت پیاسا تھا۔\nاس نے گھڑے میں کنکر ڈالے اور پانی پی لیا۔", story
+            # Page 2 has a missing story, so only page 1 is complete
+            assert store.page_done(PAGES[0]) and not store.page_done(PAGES[1])
+
+        # -------- Resumed run --------
+        server = StubServer()
+        with StoryStore(store_path, legacy_json=None) as store:
+            added = run(store, server)
+            assert added == 0 and len(store) == 4, (added, len(store))
+            # Only the incomplete page and its story that was not stored are fetched again
+            assert server.requests == Counter({"moral-stories-page2.html": 1, "story-missing.html": 1}), server.requests
+
+    print("✅ async_scraper offline check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,56 @@
-import json
-import pandas as pd
+import argparse
+import csv
+import os
+import sys
 
-# -------- Load JSON Data --------
-input_file = "all_urdu_moral_stories.json"
+from story_store import FIELDS, LEGACY_JSON, StoryStore
 
-with open(input_file, "r", encoding="utf-8") as f:
-    data = json.load(f)
 
-# -------- Convert to DataFrame --------
-df = pd.DataFrame(data)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the scraped stories to CSV and XLSX")
+    parser.add_argument("--store", default="stories.sqlite", help="Story store written by the scrapers")
+    parser.add_argument("--csv", default="all_urdu_moral_stories.csv")
+    parser.add_argument("--xlsx", default="all_urdu_moral_stories.xlsx")
+    parser.add_argument("--no-xlsx", action="store_true", help="Only write the CSV")
+    parser.add_argument("--import-json", default=LEGACY_JSON,
+                        help="Stories JSON imported into the store if it does not exist yet")
+    return parser.parse_args()
 
-# -------- Save as CSV --------
-csv_file = "all_urdu_moral_stories.csv"
-df.to_csv(csv_file, index=False, encoding="utf-8-sig")  # utf-8-sig ensures Excel reads Urdu correctly
 
-# -------- Save as XLSX --------
-xlsx_file = "all_urdu_moral_stories.xlsx"
-df.to_excel(xlsx_file, index=False, engine="openpyxl")
+args = parse_args()
 
-print(f"✅ JSON converted to CSV ({csv_file}) and XLSX ({xlsx_file}) successfully!")
\ No newline at end of file
+# -------- Open the Store --------
+# Never replace the existing exports with an empty file
+if not os.path.exists(args.store) and not os.path.exists(args.import_json):
+    sys.exit(f"❌ No story store at {args.store} (and no {args.import_json} to import); run a scraper first")
+store = StoryStore(args.store, legacy_json=args.import_json)
+if not len(store):
+    store.close()
+    sys.exit(f"❌ {args.store} holds no stories; nothing exported")
+
+# -------- Stream to CSV --------
+# utf-8-sig ensures Excel reads Urdu correctly
+with open(args.csv, "w", newline="", encoding="utf-8-sig") as f:
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    rows = 0
+    for story in store.iter_stories():
+        writer.writerow([story[field] for field in FIELDS])
+        rows += 1
+
+# -------- Stream to XLSX --------
+# A write-only workbook keeps only the current row in memory
+if not args.no_xlsx:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(FIELDS))
+    for story in store.iter_stories():
+        sheet.append([story[field] for field in FIELDS])
+    workbook.save(args.xlsx)
+
+store.close()
+
+outputs = args.csv if args.no_xlsx else f"CSV ({args.csv}) and XLSX ({args.xlsx})"
+print(f"✅ {rows} stories from {args.store} exported to {outputs} successfully!")
@@ -1,6 +1,4 @@
 import time
-import json
-import os
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
@@ -9,6 +7,8 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 
+from story_store import StoryStore
+
 # -------- Chrome Setup (VISIBLE) --------
 options = Options()
 options.add_argument("--start-maximized")
@@ -21,21 +21,19 @@ driver = webdriver.Chrome(
 wait = WebDriverWait(driver, 15)  # Increased wait to 15 seconds
 base_url = "https://www.urdupoint.com/kids/category/funny-stories-page{}.html"
 
-# File to save data
-output_file = "all_urdu_moral_stories.json"
-
-# Load existing data if file exists
-if os.path.exists(output_file):
-    with open(output_file, "r", encoding="utf-8") as f:
-        all_stories = json.load(f)
-else:
-    all_stories = []
+# Stories are appended to the store shared with the other scrapers; finished pages are skipped
+store = StoryStore("stories.sqlite")
 
 # -------- Loop Through First 11 Pages --------
 for page in range(1, 12):  # Pages 1 to 11
     print(f"\n========== PAGE {page} ==========")
 
-    driver.get(base_url.format(page))
+    page_url = base_url.format(page)
+    if store.page_done(page_url):
+        print(f"Page {page} already scraped, skipping")
+        continue
+
+    driver.get(page_url)
 
     # Wait until stories load, retry if needed
     try:
@@ -52,10 +50,11 @@ for page in range(1, 12):  # Pages 1 to 11
 
     for story in story_elements:
         link = story.get_attribute("href")
-        if link:
+        if link and link not in store:
             story_links.append(link)
 
-    print(f"Found {len(story_links)} stories on page {page}")
+    print(f"Found {len(story_links)} new stories on page {page}")
+    page_stories = []
 
     # -------- Visit Each Story --------
     for link in story_links:
@@ -95,7 +94,7 @@ for page in range(1, 12):  # Pages 1 to 11
         except:
             story_text = ""
 
-        all_stories.append({
+        page_stories.append({
             "title": title,
             "subtitle": subtitle,
             "date": date,
@@ -106,10 +105,10 @@ for page in range(1, 12):  # Pages 1 to 11
         time.sleep(1)
 
     # -------- Save After Each Page --------
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(all_stories, f, ensure_ascii=False, indent=4)
+    store.complete_page(page_url, page_stories)
 
     print(f"\n✅ Page {page} scraped and saved successfully!")
 
+store.close()
 driver.quit()
 print("\n🎉 FIRST 11 PAGES SCRAPED SUCCESSFULLY")
\ No newline at end of file
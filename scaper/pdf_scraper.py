@@ -1,36 +1,144 @@
-from pdf2image import convert_from_path
-from PIL import Image
-import pytesseract
+"""OCR scanned Urdu PDFs page by page across a process pool.
+
+    python pdf_scraper.py Hamdard_Naunehal_July_2017_Paksociety_com.pdf
+    python pdf_scraper.py magazines/ --dpi 500 --workers 8
+
+Each task renders and OCRs only its own page inside the worker, and every
+page's text is cached under --cache-dir by (PDF hash, page, dpi, lang), so
+re-runs and interrupted jobs only OCR the pages that are missing.
+"""
+import argparse
+import hashlib
 import json
+import os
 from multiprocessing import Pool, cpu_count
 
-# Path to your scanned PDF
-pdf_path = "Hamdard_Naunehal_July_2017_Paksociety_com.pdf"
+from pdf2image import convert_from_path, pdfinfo_from_path
+import pytesseract
+
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
 
-# Convert PDF pages to images (high accuracy)
-pages = convert_from_path(pdf_path, dpi=500)
 
-# Function to OCR a single page
-def ocr_page(args):
-    page_number, page_image = args
+def find_pdfs(inputs):
+    """PDF files given directly or found (recursively) in the given directories, in sorted order"""
+    pdfs = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                pdfs.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+        else:
+            pdfs.append(path)
+    return sorted(set(pdfs))
+
+
+def cache_path(cache_dir, pdf_hash, page, dpi, lang):
+    return os.path.join(cache_dir, pdf_hash[:16], f"page{page:05d}-{dpi}dpi-{lang}.json")
+
+
+def read_cache(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _init_worker():
+    # One tesseract thread per process; the pool already keeps every core busy
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def ocr_page(task):
+    """Render one page of a PDF, OCR it and cache the text"""
+    pdf_path, page, dpi, lang, cached = task
+    image = convert_from_path(pdf_path, dpi=dpi, first_page=page, last_page=page)[0]
     try:
         # OCR with Urdu language
-        text = pytesseract.image_to_string(page_image, lang="urd")
-    except:
-        # Fallback if Urdu OCR fails
-        text = pytesseract.image_to_string(page_image)
-    return {"page": page_number, "text": text.strip()}
+        text = pytesseract.image_to_string(image, lang=lang)
+    except pytesseract.TesseractError:
+        # Fallback if Urdu OCR fails; not cached, so the next run tries Urdu again
+        text = pytesseract.image_to_string(image)
+        return {"pdf": pdf_path, "page": page, "text": text.strip(), "fallback": True}
+    result = {"pdf": pdf_path, "page": page, "text": text.strip()}
+
+    # Write to a temporary file and rename it, so an interrupted job never leaves a partial entry
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    tmp_path = f"{cached}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(tmp_path, cached)
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="OCR scanned Urdu PDFs into JSON")
+    parser.add_argument("inputs", nargs="+", help="PDF files or directories of PDFs")
+    parser.add_argument("--dpi", type=int, default=500)
+    parser.add_argument("--lang", default="urd", help="Tesseract language")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="OCR processes (default: all cores)")
+    parser.add_argument("--cache-dir", default=".ocr_cache", help="Per-page OCR results reused across runs")
+    parser.add_argument("--output", default="ocr_result.json")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    pdfs = find_pdfs(args.inputs)
+    if not pdfs:
+        print("No PDFs found")
+        return
+
+    results = []
+    tasks = {}
+    # Pages of a PDF that is also given under another path are OCR'd once and copied
+    copies = []
+    for pdf_path in pdfs:
+        pdf_hash = file_sha256(pdf_path)
+        pages = pdfinfo_from_path(pdf_path)["Pages"]
+        cached_pages = 0
+        for page in range(1, pages + 1):
+            cached = cache_path(args.cache_dir, pdf_hash, page, args.dpi, args.lang)
+            result = read_cache(cached)
+            if result is not None:
+                # The same file may have been cached under another name
+                result["pdf"] = pdf_path
+                results.append(result)
+                cached_pages += 1
+            elif cached in tasks:
+                copies.append((pdf_path, cached))
+            else:
+                tasks[cached] = (pdf_path, page, args.dpi, args.lang, cached)
+        print(f"{pdf_path}: {pages} pages, {cached_pages} cached")
+
+    if tasks:
+        workers = max(1, min(args.workers, len(tasks)))
+        print(f"OCR of {len(tasks)} pages with {workers} workers...")
+        with Pool(processes=workers, initializer=_init_worker) as pool:
+            ocr_results = {}
+            for done, result in enumerate(pool.imap_unordered(ocr_page, tasks.values()), 1):
+                results.append(result)
+                ocr_results[result["pdf"], result["page"]] = result
+                fallback = f" (default language, {args.lang} OCR failed)" if result.get("fallback") else ""
+                print(f"[{done}/{len(tasks)}] {result['pdf']} page {result['page']}{fallback}")
+        # Taken from this run's results rather than the cache, which skips fallback pages
+        for pdf_path, cached in copies:
+            results.append(dict(ocr_results[tasks[cached][:2]], pdf=pdf_path))
+
+    order = {path: i for i, path in enumerate(pdfs)}
+    results.sort(key=lambda r: (order[r["pdf"]], r["page"]))
 
-# Prepare arguments for multiprocessing
-args = [(i+1, page) for i, page in enumerate(pages)]
+    # Save results to JSON
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
 
-# Use 2 cores for multiprocessing
-with Pool(processes=2) as pool:
-    results = pool.map(ocr_page, args)
+    print(f"OCR complete! {len(results)} pages saved to {args.output}")
 
-# Save results to JSON
-output_file = "ocr_result.json"
-with open(output_file, "w", encoding="utf-8") as f:
-    json.dump(results, f, ensure_ascii=False, indent=4)
 
-print(f"OCR complete! Results saved to {output_file}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
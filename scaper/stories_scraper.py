@@ -1,5 +1,4 @@
 import time
-import json
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
@@ -8,6 +7,8 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 
+from story_store import StoryStore
+
 
 # -------- Chrome Setup (VISIBLE) --------
 options = Options()
@@ -22,13 +23,19 @@ wait = WebDriverWait(driver, 10)
 
 base_url = "https://www.urdupoint.com/kids/category/moral-stories-page{}.html"
 
-all_stories = []
+# Stories are appended to the store page by page; a rerun resumes after the last completed page
+store = StoryStore("stories.sqlite")
 
 # -------- Loop Through All Pages --------
 for page in range(1, 150):  # 1 to 149
     print(f"\n========== PAGE {page} ==========")
 
-    driver.get(base_url.format(page))
+    page_url = base_url.format(page)
+    if store.page_done(page_url):
+        print(f"Page {page} already scraped, skipping")
+        continue
+
+    driver.get(page_url)
 
     # Wait until stories load
     wait.until(EC.presence_of_element_located((By.CLASS_NAME, "sharp_box")))
@@ -39,10 +46,11 @@ for page in range(1, 150):  # 1 to 149
 
     for story in story_elements:
         link = story.get_attribute("href")
-        if link:
+        if link and link not in store:
             story_links.append(link)
 
-    print(f"Found {len(story_links)} stories on page {page}")
+    print(f"Found {len(story_links)} new stories on page {page}")
+    page_stories = []
 
     # -------- Visit Each Story --------
     for link in story_links:
@@ -77,7 +85,7 @@ for page in range(1, 150):  # 1 to 149
         except:
             story_text = ""
 
-        all_stories.append({
+        page_stories.append({
             "title": title,
             "subtitle": subtitle,
             "date": date,
@@ -87,9 +95,9 @@ for page in range(1, 150):  # 1 to 149
 
         time.sleep(1)
 
-# -------- Save Everything --------
-with open("all_urdu_moral_stories.json", "w", encoding="utf-8") as f:
-    json.dump(all_stories, f, ensure_ascii=False, indent=4)
+    # -------- Save After Each Page --------
+    store.complete_page(page_url, page_stories)
 
-print("\n✅ ALL PAGES SCRAPED SUCCESSFULLY")
+print(f"\n✅ ALL PAGES SCRAPED SUCCESSFULLY ({len(store)} stories stored)")
+store.close()
 driver.quit()
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""Append-only SQLite store shared by the scrapers.
+
+Stories are keyed by URL and never rewritten, and a listing page is marked
+complete in the same transaction as its stories, so an interrupted scrape
+resumes at the first page that was not finished. A new store starts with
+the stories of the JSON file the scrapers used to write, if there is one.
+"""
+import json
+import os
+import sqlite3
+
+FIELDS = ("title", "subtitle", "date", "content", "url")
+
+# Written by the scrapers before the store existed
+LEGACY_JSON = "all_urdu_moral_stories.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL DEFAULT '',
+    subtitle TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL DEFAULT '',
+    page_url TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    stories INTEGER NOT NULL,
+    completed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+class StoryStore:
+    """Stories and completed listing pages of one scrape, in a SQLite file"""
+
+    def __init__(self, path="stories.sqlite", legacy_json=LEGACY_JSON):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        # URLs held in memory so "already scraped?" is a set lookup
+        self._urls = {row[0] for row in self.conn.execute("SELECT url FROM stories")}
+        self._pages = {row[0] for row in self.conn.execute("SELECT url FROM pages")}
+        if not self._urls and legacy_json and os.path.exists(legacy_json):
+            imported = self.import_json(legacy_json)
+            print(f"Imported {imported} stories from {legacy_json} into {path}")
+
+    def import_json(self, json_path):
+        """Append the stories of a JSON list (the scrapers' old output); returns how many were added"""
+        with open(json_path, "r", encoding="utf-8") as f:
+            stories = [story for story in json.load(f) if story.get("url")]
+        # Their listing pages are not marked complete, so the scrapers still visit them for new links
+        return self.add_stories(stories)
+
+    def __contains__(self, url):
+        return url in self._urls
+
+    def __len__(self):
+        return len(self._urls)
+
+    def page_done(self, page_url):
+        return page_url in self._pages
+
+    def add_stories(self, stories, page_url=None):
+        """Append stories whose URL is not stored yet; returns how many were added"""
+        with self.conn:
+            added = self._insert(stories, page_url)
+        self._urls.update(added)
+        return len(added)
+
+    def complete_page(self, page_url, stories):
+        """Store a listing page's stories and mark the page complete in one transaction"""
+        with self.conn:
+            added = self._insert(stories, page_url)
+            self.conn.execute("INSERT OR REPLACE INTO pages (url, stories) VALUES (?, ?)", (page_url, len(stories)))
+        # In-memory sets change only once the transaction has committed
+        self._urls.update(added)
+        self._pages.add(page_url)
+        return len(added)
+
+    def _insert(self, stories, page_url):
+        rows = {}
+        for story in stories:
+            if story["url"] not in self._urls:
+                rows.setdefault(story["url"], tuple(story.get(field) or "" for field in FIELDS) + (page_url,))
+        self.conn.executemany(
+            f"INSERT OR IGNORE INTO stories ({', '.join(FIELDS)}, page_url) VALUES (?, ?, ?, ?, ?, ?)",
+            list(rows.values()),
+        )
+        return list(rows)
+
+    def iter_stories(self, batch_size=1000):
+        """Yield stored stories as dicts in the order they were scraped, batch_size rows at a time"""
+        cursor = self.conn.execute(f"SELECT {', '.join(FIELDS)} FROM stories ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(FIELDS, row))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
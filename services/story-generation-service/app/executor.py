@@ -0,0 +1,154 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Items a streaming worker may produce ahead of its consumer
+STREAM_BUFFER = 4
+
+
+class QueueFullError(Exception):
+    """Raised when every worker is busy and the wait queue is at its depth limit."""
+
+
+_DONE = object()
+
+
+class GenerationExecutor:
+    """Bounded thread pool that keeps CPU-bound generation off the event loop.
+
+    At most max_workers jobs run at once and at most max_queue more wait for a
+    worker; submitting beyond that raises QueueFullError instead of queueing
+    without limit.
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None):
+        self.max_workers = max_workers or int(os.environ.get("GENERATION_WORKERS", min(4, os.cpu_count() or 1)))
+        self.max_queue = max_queue if max_queue is not None else int(os.environ.get("GENERATION_QUEUE_DEPTH", 16))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="generate")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def depth(self) -> int:
+        """Jobs currently running or waiting for a worker."""
+        return self._pending
+
+    @property
+    def queued(self) -> int:
+        """Jobs waiting for a worker."""
+        return max(0, self._pending - self.max_workers)
+
+    def _submit(self, fn, *args, idle_only: bool = False):
+        with self._lock:
+            if idle_only and self._pending >= self.max_workers:
+                return None
+            if self._pending >= self.max_workers + self.max_queue:
+                raise QueueFullError("Generation queue is full")
+            self._pending += 1
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        # The slot is held until the job finishes, even if the caller stops waiting
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on a worker thread and await its result."""
+        return await asyncio.wrap_future(self._submit(fn, *args))
+
+    def submit_idle(self, fn, *args):
+        """Low-priority submission: runs fn(*args) only if a worker is idle right now.
+
+        Returns the future, or None when every worker is busy, so background
+        work never waits in the queue ahead of requests. It still counts
+        towards depth while it runs.
+        """
+        return self._submit(fn, *args, idle_only=True)
+
+    def stream(self, gen_fn, *args) -> "GenerationStream":
+        """Run the generator gen_fn(*args) on a worker thread and relay its items.
+
+        The slot is claimed here, so QueueFullError is raised before a
+        streaming response starts. The worker stays at most STREAM_BUFFER
+        items ahead of the consumer and stops once the returned stream is
+        closed or cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=STREAM_BUFFER)
+        stop = threading.Event()
+
+        def put(entry) -> bool:
+            # Blocks while the queue is full; gives up once the stream is cancelled
+            try:
+                future = asyncio.run_coroutine_threadsafe(queue.put(entry), loop)
+            except RuntimeError:
+                # Event loop already closed during shutdown
+                return False
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        return False
+
+        def produce():
+            if stop.is_set():
+                return
+            error = None
+            try:
+                for item in gen_fn(*args):
+                    if stop.is_set() or not put((item, None)):
+                        return
+            except Exception as e:
+                error = e
+            put((_DONE, error))
+
+        return GenerationStream(queue, stop, self._submit(produce))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class GenerationStream:
+    """Async iterator over the items of a GenerationExecutor.stream job.
+
+    cancel() (also called by aclose() and when iteration ends) stops the
+    worker at its next item. A job that has not reached a worker yet is
+    dropped and its slot released right away.
+    """
+
+    def __init__(self, queue: asyncio.Queue, stop: threading.Event, future: concurrent.futures.Future):
+        self._queue = queue
+        self._stop = stop
+        self._future = future
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._stop.is_set():
+            raise StopAsyncIteration
+        item, error = await self._queue.get()
+        if item is _DONE:
+            self.cancel()
+            if error is not None:
+                raise error
+            raise StopAsyncIteration
+        return item
+
+    def cancel(self):
+        self._stop.set()
+        self._future.cancel()
+
+    async def aclose(self):
+        self.cancel()
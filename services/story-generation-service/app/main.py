@@ -1,21 +1,29 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse
 import asyncio
+import hmac
 import os
 import sys
-from .schemas import GenerateRequest, GenerateResponse
-from .model_loader import TrigramModelLoader
-from .tokenizer import BPETokenizer
+import threading
+import time
+import numpy as np
+from typing import Optional
+from .schemas import GenerateRequest, GenerateResponse, GenerateBatchRequest, GenerateBatchResponse, ReloadRequest
+from .reloader import ModelBundle, ModelReloader
+from .token_table import TokenTable
+from .executor import GenerationExecutor, QueueFullError
+from .streaming import CancellableStreamingResponse, Utf8ChunkDecoder
+from .metrics import MetricsRegistry, RequestMetricsMiddleware, THROUGHPUT_BUCKETS
+from .lru import LRUCache
+from .story_pool import StoryPool
 
 # Fix pickling issue: The model/tokenizer was saved with module name 'bpe_tokenizer'
 # We alias 'bpe_tokenizer' to the service's 'app.tokenizer' module.
 import app.tokenizer
 sys.modules['bpe_tokenizer'] = app.tokenizer
 
-TOKENIZER_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "bpe_tokenizer.pkl")
-tokenizer = BPETokenizer(vocab_size=250)
-tokenizer.load(TOKENIZER_PATH)
+TOKENIZER_PATH = os.environ.get("TOKENIZER_PATH") or os.path.join(os.path.dirname(__file__), "..", "models", "bpe_tokenizer.pkl")
 
 
 app = FastAPI(title="Urdu Children's Story Generation API")
@@ -29,97 +37,430 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load the model
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "trigram_model.pkl")
-try:
-    model_loader = TrigramModelLoader(MODEL_PATH)
-except Exception as e:
-    print(f"Error loading model: {e}")
-    model_loader = None
+# Prometheus-style metrics served from /metrics. Hot-path cost is a few perf_counter
+# calls per request (one per token while streaming) and a locked update when it ends.
+metrics = MetricsRegistry()
+REQUESTS_TOTAL = metrics.counter("story_requests_total", "HTTP requests by endpoint and status", labels=("endpoint", "status"))
+REQUEST_LATENCY = metrics.histogram("story_request_latency_seconds", "Request latency by endpoint, including the whole stream", labels=("endpoint",))
+STAGE_SECONDS = metrics.histogram("story_stage_seconds", "Time spent per request in the encode, sample and decode stages", labels=("stage",))
+TOKENS_GENERATED = metrics.counter("story_tokens_generated_total", "Tokens emitted by the sampler")
+TOKENS_PER_SECOND = metrics.histogram("story_tokens_per_second", "Sampling throughput per request", buckets=THROUGHPUT_BUCKETS)
+# Story pool refills are not requests, so their cost is kept out of the per-request metrics above
+POOL_GENERATION_SECONDS = metrics.histogram("story_pool_generation_seconds", "Time taken to pre-generate one pooled story")
+POOL_TOKENS_GENERATED = metrics.counter("story_pool_tokens_generated_total", "Tokens sampled for pre-generated stories")
+app.add_middleware(
+    RequestMetricsMiddleware,
+    requests=REQUESTS_TOTAL,
+    latency=REQUEST_LATENCY,
+    endpoints={"/generate", "/generate-batch", "/generate-stream", "/health"},
+)
+
+# Load the model, preferring the memory-mapped binary export from retrain_model.py
+# A MODEL_PATH environment variable overrides the bundled files
+MODEL_PATH = os.environ.get("MODEL_PATH") or os.path.join(os.path.dirname(__file__), "..", "models", "trigram_model.bin")
+if not os.path.exists(MODEL_PATH):
+    MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "trigram_model.pkl")
+# /admin/reload only loads files from this directory, so the body cannot point it at arbitrary
+# pickles; defaults to the directory of the configured model
+MODELS_DIR = os.path.realpath(os.environ.get("MODELS_DIR") or os.path.dirname(MODEL_PATH))
+# Per-context sampling CDFs kept in an LRU; the hottest training contexts are precomputed at startup
+SAMPLER_CACHE_SIZE = int(os.environ.get("SAMPLER_CACHE_SIZE", 1024))
+SAMPLER_CACHE_WARM = int(os.environ.get("SAMPLER_CACHE_WARM", 256))
+# Constrained sampling gives EOT zero probability up front until a story reaches its minimum length,
+# instead of drawing it and rejecting it; the story distribution is the same either way
+CONSTRAINED_SAMPLING = os.environ.get("CONSTRAINED_SAMPLING", "1") != "0"
+# The tokenizer and model are loaded as one bundle that /admin/reload (or, with MODEL_WATCH_INTERVAL
+# seconds > 0, a change to either file) replaces after a smoke test. Requests keep the bundle they
+# started with, so in-flight generations finish on the old version.
+reloader = ModelReloader(
+    MODEL_PATH,
+    TOKENIZER_PATH,
+    cache_size=SAMPLER_CACHE_SIZE,
+    warm=SAMPLER_CACHE_WARM,
+    constrained=CONSTRAINED_SAMPLING,
+    watch_interval=float(os.environ.get("MODEL_WATCH_INTERVAL", 0)),
+)
+reloader.load_initial()
+# Reloads are refused unless ADMIN_TOKEN is set and sent in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Generation is CPU-bound, so it runs on a bounded worker pool instead of the event loop.
+# Sized by GENERATION_WORKERS and GENERATION_QUEUE_DEPTH.
+executor = GenerationExecutor()
+QUEUE_FULL_DETAIL = "Generation queue is full, please retry shortly"
+
+# Streamed text is coalesced into chunks of about this many bytes, or sent after this many seconds
+STREAM_CHUNK_BYTES = int(os.environ.get("STREAM_CHUNK_BYTES", 256))
+STREAM_FLUSH_INTERVAL = float(os.environ.get("STREAM_FLUSH_INTERVAL", 0.1))
+# Optional delay between streamed chunks for a typing effect; off unless configured
+STREAM_PACE_MS = float(os.environ.get("STREAM_PACE_MS", 0))
+
+# Seeded requests are deterministic, so their responses are kept in an LRU and repeats skip the sampler
+response_cache = LRUCache(int(os.environ.get("RESPONSE_CACHE_SIZE", 256)))
+
+def current_bundle() -> ModelBundle:
+    """The active model bundle; raises a 500 if none has loaded."""
+    bundle = reloader.current
+    if bundle is None:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    return bundle
+
+def pooled_story(key: tuple) -> Optional[GenerateResponse]:
+    """Pre-generates one unseeded story for a (prefix, max_length) key with the active bundle.
+
+    Runs on the generation executor, but only when a worker is idle, so the
+    work shows up in the queue depth without ever queueing ahead of requests.
+    Returns None when there is no model or no idle worker.
+    """
+    bundle = reloader.current
+    if bundle is None:
+        return None
+    request = GenerateRequest(prefix=key[0], max_length=key[1])
+    future = executor.submit_idle(generate_text, bundle, request, record_pool_generation)
+    return future.result() if future is not None else None
+
+# Unseeded /generate requests for popular prefixes are answered from stories generated ahead of
+# time. A background thread submits each refill to the generation executor when a worker is idle,
+# stays under STORY_POOL_CPU_SHARE of a core and pauses while requests are queued. STORY_POOL_SIZE stories are kept for each of the STORY_POOL_PREFIXES
+# hottest prefixes whose request count, halved every STORY_POOL_HALF_LIFE seconds, reaches
+# STORY_POOL_MIN_SCORE; a size of 0 disables the pool.
+STORY_POOL_SIZE = int(os.environ.get("STORY_POOL_SIZE", 4))
+story_pool = StoryPool(
+    pooled_story,
+    size=STORY_POOL_SIZE,
+    max_prefixes=int(os.environ.get("STORY_POOL_PREFIXES", 8)),
+    min_score=float(os.environ.get("STORY_POOL_MIN_SCORE", 2.5)),
+    half_life=float(os.environ.get("STORY_POOL_HALF_LIFE", 300)),
+    cpu_share=float(os.environ.get("STORY_POOL_CPU_SHARE", 0.25)),
+    is_busy=lambda: executor.queued > 0,
+)
+if STORY_POOL_SIZE > 0:
+    story_pool.start()
+
+def clear_model_caches(bundle: ModelBundle):
+    # Cached and pooled stories carry the model version, so after a swap they can only waste space
+    response_cache.clear()
+    story_pool.clear()
+
+reloader.on_swap = clear_model_caches
+
+metrics.gauge("story_model_load_seconds", "Time taken to load and warm the active model and tokenizer",
+              lambda: reloader.current.load_seconds if reloader.current is not None else None)
+metrics.gauge("story_model_reloads_total", "Successful model reloads", lambda: reloader.reloads, kind="counter")
+metrics.gauge("story_model_reload_failures_total", "Model loads rejected by loading or the smoke test",
+              lambda: reloader.failures, kind="counter")
+metrics.gauge("story_queue_depth", "Generation jobs running or waiting for a worker", lambda: executor.depth)
+metrics.gauge("story_queue_waiting", "Generation jobs waiting for a worker", lambda: executor.queued)
+metrics.gauge("story_sampler_cache_hits_total", "Sampling CDF cache hits of the active model",
+              lambda: reloader.current.loader.cdf_cache.hits if reloader.current is not None else None, kind="counter")
+metrics.gauge("story_sampler_cache_misses_total", "Sampling CDF cache misses of the active model",
+              lambda: reloader.current.loader.cdf_cache.misses if reloader.current is not None else None, kind="counter")
+metrics.gauge("story_response_cache_hits_total", "Seeded requests answered from the response cache",
+              lambda: response_cache.hits, kind="counter")
+metrics.gauge("story_response_cache_misses_total", "Seeded requests that had to be generated",
+              lambda: response_cache.misses, kind="counter")
+metrics.gauge("story_pool_hits_total", "Unseeded requests answered with a pre-generated story",
+              lambda: story_pool.hits, kind="counter")
+metrics.gauge("story_pool_misses_total", "Unseeded requests with no pre-generated story ready",
+              lambda: story_pool.misses, kind="counter")
+metrics.gauge("story_pool_generated_total", "Stories pre-generated for the pool", lambda: story_pool.generated, kind="counter")
+metrics.gauge("story_pool_ready", "Pre-generated stories waiting to be served", lambda: story_pool.stats()["stories"])
+
+def record_generation(encode_seconds: float, sample_seconds: float, decode_seconds: float, tokens: int):
+    """Records per-stage timings and throughput for one generation job."""
+    STAGE_SECONDS.observe(encode_seconds, "encode")
+    STAGE_SECONDS.observe(sample_seconds, "sample")
+    STAGE_SECONDS.observe(decode_seconds, "decode")
+    TOKENS_GENERATED.inc(tokens)
+    if sample_seconds > 0:
+        TOKENS_PER_SECOND.observe(tokens / sample_seconds)
+
+def record_pool_generation(encode_seconds: float, sample_seconds: float, decode_seconds: float, tokens: int):
+    """Records one pre-generated story in the story_pool_* metrics only."""
+    POOL_GENERATION_SECONDS.observe(encode_seconds + sample_seconds + decode_seconds)
+    POOL_TOKENS_GENERATED.inc(tokens)
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    reloader.stop()
+    story_pool.stop()
+    executor.shutdown()
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "model_loaded": model_loader is not None}
+    bundle = reloader.current
+    return {
+        "status": "ok",
+        "model_loaded": bundle is not None,
+        "model_version": bundle.version if bundle is not None else None,
+        "queue_depth": executor.depth,
+        "sampler_cache": bundle.loader.cdf_cache.stats() if bundle is not None else None,
+        "response_cache": response_cache.stats(),
+        "story_pool": story_pool.stats() if STORY_POOL_SIZE > 0 else None,
+    }
 
-@app.post("/generate", response_model=GenerateResponse)
-async def generate_story(request: GenerateRequest):
-    if model_loader is None:
-        raise HTTPException(status_code=500, detail="Model not loaded")
+def reload_status() -> dict:
+    bundle = reloader.current
+    return {
+        "model_version": bundle.version if bundle is not None else None,
+        "model_path": bundle.model_path if bundle is not None else None,
+        "tokenizer_path": bundle.tokenizer_path if bundle is not None else None,
+        "reloading": reloader.reloading,
+        "reloads": reloader.reloads,
+        "last_error": reloader.last_error,
+    }
+
+def check_admin_token(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if token is None or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def models_dir_path(path: Optional[str]) -> Optional[str]:
+    """Resolves a reload path against MODELS_DIR; raises a 400 if it ends up outside it."""
+    if path is None:
+        return None
+    resolved = os.path.realpath(os.path.join(MODELS_DIR, path))
+    if os.path.commonpath([resolved, MODELS_DIR]) != MODELS_DIR:
+        raise HTTPException(status_code=400, detail=f"{path} is outside the models directory")
+    return resolved
+
+@app.get("/admin/model")
+def model_status(x_admin_token: Optional[str] = Header(default=None)):
+    check_admin_token(x_admin_token)
+    return reload_status()
+
+@app.post("/admin/reload", status_code=202)
+def reload_model(request: Optional[ReloadRequest] = None, x_admin_token: Optional[str] = Header(default=None)):
+    """Load new artifacts in the background; the swap happens once they pass the smoke test."""
+    check_admin_token(x_admin_token)
+    request = request or ReloadRequest()
+    model_path = models_dir_path(request.model_path)
+    tokenizer_path = models_dir_path(request.tokenizer_path)
+    if not reloader.reload(model_path, tokenizer_path):
+        raise HTTPException(status_code=409, detail="A reload is already in progress")
+    return reload_status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def decode_generated(token_table: TokenTable, prefix: str, generated_tokens: list) -> str:
+    """Filters special tokens from generated ids and decodes them after the prefix."""
+    result_parts = []
+    token_ids_to_decode = []
     
-    try:
-        # 1. Encode the prefix using BPE Tokenizer
-        prefix_ids = tokenizer.encode(request.prefix)
-        
-        # 2. Generate tokens using the Trigram Model
-        # Pass mapping for sentence boundary detection
-        generated_tokens = list(model_loader.generate_stream(
-            prefix_ids, 
-            tokenizer_mapping=tokenizer.id_to_token, 
-            max_length=request.max_length or 700
-        ))
-        
-        # 3. Filter and Decode
-        special_chars = {model_loader.BOS, model_loader.EOS, model_loader.EOP, model_loader.EOT, '\uFFF0', '\uFFF1', '\uFFF2'}
-        special_ids = {tokenizer.vocab.get(char) for char in special_chars if char in tokenizer.vocab}
-        
-        result_parts = []
-        token_ids_to_decode = []
+    for t in generated_tokens:
+        if isinstance(t, str):
+            # Flush pending token IDs before adding the string (like \n\n)
+            if token_ids_to_decode:
+                result_parts.append(token_table.decode(token_ids_to_decode))
+                token_ids_to_decode = []
+            result_parts.append(t)
+        else:
+            token_ids_to_decode.append(t)
+    
+    if token_ids_to_decode:
+        result_parts.append(token_table.decode(token_ids_to_decode))
         
-        for t in generated_tokens:
-            if isinstance(t, str):
-                # Flush pending token IDs before adding the string (like \n\n)
-                if token_ids_to_decode:
-                    decoded = tokenizer.decode(token_ids_to_decode)
-                    # Clean any trailing special chars from decoding
-                    for sc in special_chars:
-                        decoded = decoded.replace(sc, "")
-                    result_parts.append(decoded)
-                    token_ids_to_decode = []
-                result_parts.append(t)
-            elif t not in special_ids:
-                token_ids_to_decode.append(t)
+    generated_text = "".join(result_parts)
         
-        if token_ids_to_decode:
-            decoded = tokenizer.decode(token_ids_to_decode)
-            for sc in special_chars:
-                decoded = decoded.replace(sc, "")
-            result_parts.append(decoded)
-            
-        generated_text = "".join(result_parts)
-            
-        return GenerateResponse(generated_text=request.prefix + " " + generated_text)
+    return prefix + " " + generated_text
+
+def request_rng(request: GenerateRequest) -> np.random.Generator:
+    """Per-request random generator, seeded when the request gives a seed."""
+    return np.random.default_rng(request.seed)
+
+def response_cache_key(bundle: ModelBundle, request: GenerateRequest, mode: str):
+    """Cache key for a seeded request, or None if its output is not reproducible.
+
+    The batched sampler sums probabilities in a different order, so batch and
+    single generation are cached separately.
+    """
+    if request.seed is None:
+        return None
+    return (mode, request.prefix, request.max_length or 700, request.seed, bundle.version, CONSTRAINED_SAMPLING)
+
+def generate_text(bundle: ModelBundle, request: GenerateRequest, record=record_generation) -> GenerateResponse:
+    """Runs the full encode, sample and decode pipeline for one request (blocking).
+
+    record receives the stage timings and token count; the story pool passes its own.
+    """
+    # 1. Encode the prefix using BPE Tokenizer
+    started = time.perf_counter()
+    prefix_ids = bundle.tokenizer.encode(request.prefix)
+    encoded = time.perf_counter()
+    
+    # 2. Generate tokens using the Trigram Model
+    # Pass mapping for sentence boundary detection
+    stats = {}
+    generated_tokens = list(bundle.loader.generate_stream(
+        prefix_ids, 
+        tokenizer_mapping=bundle.tokenizer.id_to_token, 
+        max_length=request.max_length or 700,
+        constrained=CONSTRAINED_SAMPLING,
+        stats=stats,
+        rng=request_rng(request),
+    ))
+    sampled = time.perf_counter()
+    
+    generated_text = decode_generated(bundle.token_table, request.prefix, generated_tokens)
+    record(encoded - started, sampled - encoded, time.perf_counter() - sampled, stats["tokens"])
+    return GenerateResponse(generated_text=generated_text, draws=stats["draws"], model_version=bundle.version)
+
+def generate_texts(bundle: ModelBundle, requests: list) -> list:
+    """Generates several stories together with the batched sampler (blocking)."""
+    stats = []
+    started = time.perf_counter()
+    prefixes = [bundle.tokenizer.encode(r.prefix) for r in requests]
+    encoded = time.perf_counter()
+    outputs = bundle.loader.generate_batch(
+        prefixes,
+        tokenizer_mapping=bundle.tokenizer.id_to_token,
+        max_lengths=[r.max_length or 700 for r in requests],
+        constrained=CONSTRAINED_SAMPLING,
+        stats=stats,
+        rngs=[request_rng(r) for r in requests],
+    )
+    sampled = time.perf_counter()
+    responses = [
+        GenerateResponse(
+            generated_text=decode_generated(bundle.token_table, r.prefix, tokens),
+            draws=story_stats["draws"],
+            model_version=bundle.version,
+        )
+        for r, tokens, story_stats in zip(requests, outputs, stats)
+    ]
+    record_generation(encoded - started, sampled - encoded, time.perf_counter() - sampled,
+                      sum(story_stats["tokens"] for story_stats in stats))
+    return responses
+
+@app.post("/generate", response_model=GenerateResponse)
+async def generate_story(request: GenerateRequest):
+    bundle = current_bundle()
+    cache_key = response_cache_key(bundle, request, "single")
+    if cache_key is not None:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    elif STORY_POOL_SIZE > 0:
+        pool_key = (request.prefix, request.max_length or 700)
+        story_pool.record(pool_key)
+        pooled = story_pool.take(pool_key, bundle.version)
+        if pooled is not None:
+            return pooled
+
+    try:
+        response = await executor.run(generate_text, bundle, request)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail=QUEUE_FULL_DETAIL)
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+    if cache_key is not None:
+        response_cache.put(cache_key, response)
+    return response
+
+
+@app.post("/generate-batch", response_model=GenerateBatchResponse)
+async def generate_story_batch(request: GenerateBatchRequest):
+    bundle = current_bundle()
+    # Only stories missing from the response cache go to the sampler
+    cache_keys = [response_cache_key(bundle, r, "batch") for r in request.requests]
+    stories = [response_cache.get(key) if key is not None else None for key in cache_keys]
+    missing = [i for i, story in enumerate(stories) if story is None]
+
+    if missing:
+        try:
+            generated = await executor.run(generate_texts, bundle, [request.requests[i] for i in missing])
+        except QueueFullError:
+            raise HTTPException(status_code=503, detail=QUEUE_FULL_DETAIL)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
+        for i, story in zip(missing, generated):
+            stories[i] = story
+            if cache_keys[i] is not None:
+                response_cache.put(cache_keys[i], story)
+
+    return GenerateBatchResponse(stories=stories)
+
 
 @app.post("/generate-stream")
-async def generate_story_stream(request: GenerateRequest):
-    if model_loader is None:
-        raise HTTPException(status_code=500, detail="Model not loaded")
-    
-    special_chars = {model_loader.BOS, model_loader.EOS, model_loader.EOP, model_loader.EOT, '\uFFF0', '\uFFF1', '\uFFF2'}
-    special_ids = {tokenizer.vocab.get(char) for char in special_chars if char in tokenizer.vocab}
+async def generate_story_stream(request: GenerateRequest, http_request: Request):
+    bundle = current_bundle()
+    token_table = bundle.token_table
     
-    async def token_generator():
-        prefix_ids = tokenizer.encode(request.prefix)
-        
-        for token in model_loader.generate_stream(
+    # Set when the client goes away so the worker stops sampling at the next token
+    cancelled = threading.Event()
+    pace = (request.pace_ms if request.pace_ms is not None else STREAM_PACE_MS) / 1000
+
+    def decoded_tokens():
+        started = time.perf_counter()
+        prefix_ids = bundle.tokenizer.encode(request.prefix)
+        decoder = Utf8ChunkDecoder(STREAM_CHUNK_BYTES, STREAM_FLUSH_INTERVAL)
+        encoded = time.perf_counter()
+        # Sampling and decoding interleave, so decode time is summed per token and sampling gets the rest
+        decode_seconds = 0.0
+        stats = {}
+        tokens = bundle.loader.generate_stream(
             prefix_ids, 
-            tokenizer_mapping=tokenizer.id_to_token, 
-            max_length=request.max_length or 700
-        ):
-            if isinstance(token, str):
-                yield token
-            elif token not in special_ids and token not in special_chars:
-                decoded_token = tokenizer.decode([token])
-                yield decoded_token
-            
-            await asyncio.sleep(0.04) 
-
-    return StreamingResponse(token_generator(), media_type="text/plain")
+            tokenizer_mapping=bundle.tokenizer.id_to_token, 
+            max_length=request.max_length or 700,
+            constrained=CONSTRAINED_SAMPLING,
+            stats=stats,
+            rng=request_rng(request),
+        )
+        
+        try:
+            for token in tokens:
+                if cancelled.is_set():
+                    return
+                decode_started = time.perf_counter()
+                if isinstance(token, str):
+                    chunk = decoder.feed(token.encode('utf-8'))
+                elif not token_table.is_special[token]:
+                    chunk = decoder.feed(token_table.token_bytes[token])
+                else:
+                    chunk = None
+                decode_seconds += time.perf_counter() - decode_started
+                if chunk:
+                    yield chunk
+
+            chunk = decoder.flush()
+            if chunk:
+                yield chunk
+        finally:
+            tokens.close()
+            record_generation(encoded - started, time.perf_counter() - encoded - decode_seconds,
+                              decode_seconds, stats.get("tokens", 0))
+
+    try:
+        chunks = executor.stream(decoded_tokens)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail=QUEUE_FULL_DETAIL)
+
+    def close_stream():
+        cancelled.set()
+        chunks.cancel()
+
+    async def token_generator():
+        try:
+            async for chunk in chunks:
+                if await http_request.is_disconnected():
+                    break
+                yield chunk
+                if pace:
+                    await asyncio.sleep(pace)
+        finally:
+            close_stream()
 
+    # on_close also runs when the client leaves before the first chunk, so the worker never samples on
+    return CancellableStreamingResponse(token_generator(), on_close=close_stream, media_type="text/plain",
+                                        headers={"X-Model-Version": bundle.version})
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,155 @@
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds, from a cached short story up to a long queued one
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Per-request throughput buckets in generated tokens per second
+THROUGHPUT_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            yield self.name + _format_labels(self.labels, values), total
+
+
+class Gauge:
+    """Value read from a callback when metrics are collected, so it costs nothing between scrapes.
+
+    kind can be set to "counter" for totals that another object already keeps.
+    """
+
+    def __init__(self, name: str, help_text: str, read, kind: str = "gauge"):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.kind = kind
+
+    def samples(self):
+        value = self.read()
+        if value is not None:
+            yield self.name, value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a running sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # One slot per bucket plus +Inf, then the sum
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                yield self.name + "_bucket" + _format_labels(self.labels, values, f'le="{bound}"'), cumulative
+            yield self.name + "_sum" + _format_labels(self.labels, values), series[-1]
+            yield self.name + "_count" + _format_labels(self.labels, values), cumulative
+
+
+class MetricsRegistry:
+    """Holds the service metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, read, kind: str = "gauge") -> Gauge:
+        return self.register(Gauge(name, help_text, read, kind))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS, labels: tuple = ()) -> Histogram:
+        return self.register(Histogram(name, help_text, buckets, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, value in metric.samples():
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware that counts requests and times them until the last body byte is sent.
+
+    Streaming responses are therefore timed over the whole stream, not just
+    until the headers go out. Only paths listed in endpoints are recorded so
+    unknown URLs cannot grow the label set.
+    """
+
+    def __init__(self, app, requests: Counter, latency: Histogram, endpoints: set):
+        self.app = app
+        self.requests = requests
+        self.latency = latency
+        self.endpoints = endpoints
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.endpoints:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            path = scope["path"]
+            self.requests.inc(1, path, str(status[0]))
+            self.latency.observe(time.perf_counter() - start, path)
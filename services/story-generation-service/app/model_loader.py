@@ -1,8 +1,13 @@
+import hashlib
+import json
+import os
 import pickle
+import struct
 import numpy as np
-import random
 from typing import List, Tuple
 from collections import Counter
+from .token_table import TokenTable
+from .lru import LRUCache
 
 class TrigramLanguageModel:
     def __init__(self, lambda1=0.1, lambda2=0.3, lambda3=0.6):
@@ -37,8 +42,119 @@ class CustomUnpickler(pickle.Unpickler):
             return TrigramLanguageModel
         return super().find_class(module, name)
 
+MODEL_MAGIC = b"URTRIGRM"
+# Start id retrain_model.py pads stories with, for pickled models that do not record it
+DEFAULT_START_ID = 0
+# Version 2 adds "<name>_codebook" sections for counts quantised by retrain_model.py --count-storage logcount8
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+
+
+def is_binary_model(model_path: str) -> bool:
+    """True if the file starts with the binary trigram model magic bytes."""
+    with open(model_path, 'rb') as f:
+        return f.read(len(MODEL_MAGIC)) == MODEL_MAGIC
+
+
+def model_digest(model_path: str) -> str:
+    """Short content hash of a file (used for the small tokenizer pickle)."""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def file_fingerprint(model_path: str) -> str:
+    """Short hash of a file's size and modification time, for models without a recorded digest."""
+    stat = os.stat(model_path)
+    return hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:12]
+
+
 class TrigramModelLoader:
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, cache_size: int = 1024):
+        self.special_ids = {}
+        # Hashing the whole file would read every page of the memmap, so binary models are versioned
+        # by the content digest retrain_model.py writes into the header, others by size and mtime
+        self.version = None
+        # Sampling CDFs of recently used contexts, see _context_cdf
+        self.cdf_cache = LRUCache(cache_size)
+        if is_binary_model(model_path):
+            self._load_binary(model_path)
+        else:
+            self._load_pickle(model_path)
+        if self.version is None:
+            self.version = file_fingerprint(model_path)
+
+        self.EOS = '\uFFF0'
+        self.EOP = '\uFFF1'
+        self.EOT = '\uFFF2'
+        self.BOS = '<BOS>'
+
+        # Vocab positions of the special tokens, so per-token checks are array reads. bind_tokenizer
+        # refines them with the tokenizer's ids, which is the only source for pickled models.
+        special_tokens = {self.BOS, self.EOS, self.EOP, self.EOT}
+        # Kept so rebinding to another tokenizer starts again from what the model itself knows
+        self._model_special_positions = (
+            np.array([t in special_tokens for t in self.vocab], dtype=bool),
+            np.array([t == self.EOT for t in self.vocab], dtype=bool),
+        )
+        self._set_special_positions(*self._model_special_positions)
+        self._bound_tokenizer = None
+
+    def _set_special_positions(self, is_special_position: np.ndarray, is_eot_position: np.ndarray):
+        """Adopt special/EOT vocab positions, adding the model's special_ids, and rebuild the sampling mask."""
+        is_special_position = is_special_position.copy()
+        is_eot_position = is_eot_position.copy()
+        for name, token_id in self.special_ids.items():
+            position = self.token_index.get(token_id, -1)
+            if position >= 0:
+                is_special_position[position] = True
+                if name == 'eot':
+                    is_eot_position[position] = True
+        self.is_special_position = is_special_position
+        # A tokenizer may learn the story end as several tokens (e.g. EOT alone and EOS+EOT)
+        self.is_eot_position = is_eot_position
+
+        # Mask for constrained sampling: EOT, for stories that have not reached min_tokens yet.
+        # Other specials stay drawable because, though never emitted, they advance the context.
+        self.sampling_masks = {'skip_eot': is_eot_position if is_eot_position.any() else None}
+        # Masked CDFs built with the previous mask are stale
+        self.cdf_cache.clear()
+
+    def bind_tokenizer(self, tokenizer_mapping: dict) -> TokenTable:
+        """Precompute the per-id token table for a tokenizer and align its flags to vocab positions.
+
+        Ids the tokenizer only uses for markers (EOS, EOP, EOT) become special
+        positions, and those containing EOT end the story, so binary and
+        pickled models of the same counts sample alike.
+        """
+        special_ids = [i for i in self.special_ids.values() if isinstance(i, int) and i >= 0]
+        table = TokenTable(tokenizer_mapping, special_ids=special_ids)
+        size = len(table.ends_sentence)
+
+        def per_position(flags):
+            return np.array([isinstance(t, int) and 0 <= t < size and bool(flags[t]) for t in self.vocab], dtype=bool)
+
+        eot_bytes = self.EOT.encode('utf-8')
+        ends_story = table.is_special & np.array([eot_bytes in raw for raw in table.token_bytes], dtype=bool)
+        model_special, model_eot = self._model_special_positions
+        self._set_special_positions(model_special | per_position(table.is_special),
+                                    model_eot | per_position(ends_story))
+
+        self._bound_tokenizer = (tokenizer_mapping, table, per_position(table.ends_sentence))
+        return table
+
+    def _sentence_end_flags(self, tokenizer_mapping: dict):
+        """Per-position "ends sentence" flags for tokenizer_mapping, built on first use."""
+        if not tokenizer_mapping:
+            return None
+        bound = self._bound_tokenizer
+        if bound is None or bound[0] is not tokenizer_mapping:
+            self.bind_tokenizer(tokenizer_mapping)
+            bound = self._bound_tokenizer
+        return bound[2]
+
+    def _load_pickle(self, model_path: str):
         # We need TrigramLanguageModel in the namespace for pickle to work
         # If the model was saved as an instance of TrigramLanguageModel
         with open(model_path, 'rb') as f:
@@ -72,25 +188,152 @@ class TrigramModelLoader:
             self.lambda2 = data['lambda2']
             self.lambda3 = data['lambda3']
 
-        self.EOS = '\uFFF0'
-        self.EOP = '\uFFF1'
-        self.EOT = '\uFFF2'
-        self.BOS = '<BOS>'
+        # Same position order as the binary export, so both formats sample alike for a seed
+        try:
+            self.vocab = sorted(self.vocab)
+        except TypeError:
+            pass
+        # retrain_model.py pads every story with start id 0; binary models record it in the header
+        if DEFAULT_START_ID in self.vocab_set:
+            self.special_ids = {'start': DEFAULT_START_ID}
+        self._build_successor_index()
+
+    def _load_binary(self, model_path: str):
+        """Map a model exported by retrain_model.py without copying its arrays.
+
+        The file is opened with np.memmap, so startup only parses the JSON
+        header and forked workers share the count arrays via the page cache.
+        """
+        with open(model_path, 'rb') as f:
+            f.read(len(MODEL_MAGIC))
+            version, header_len = struct.unpack('<II', f.read(8))
+            if version not in SUPPORTED_FORMAT_VERSIONS:
+                raise ValueError(f"Unsupported model format version {version} (expected one of {SUPPORTED_FORMAT_VERSIONS})")
+            header = json.loads(f.read(header_len).decode('utf-8'))
+
+        buf = np.memmap(model_path, dtype=np.uint8, mode='r')
+        sections = {}
+        for name, meta in header['sections'].items():
+            dtype = np.dtype(meta['dtype'])
+            offset = header['data_offset'] + meta['offset']
+            nbytes = int(np.prod(meta['shape'], dtype=np.int64)) * dtype.itemsize
+            sections[name] = buf[offset:offset + nbytes].view(dtype).reshape(meta['shape'])
+
+        if header.get('content_sha256'):
+            self.version = header['content_sha256'][:12]
+        self.lambda1, self.lambda2, self.lambda3 = header['lambdas']
+        self.total_tokens = header['total_tokens']
+        self.special_ids = header.get('special_ids', {})
+        self.vocab = sections['vocab'].tolist()
+        self.vocab_set = set(self.vocab)
+        self.token_index = {t: i for i, t in enumerate(self.vocab)}
+
+        self.unigram_counts = sections['unigram_counts']
+        self.uni_totals = sections['unigram_totals']
+        self.bi_indptr = sections['bigram_indptr']
+        self.bi_next = sections['bigram_next']
+        self.bi_counts = _count_section(sections, 'bigram_counts')
+        self.tri_ctx = sections['trigram_context']
+        self.tri_totals = sections['trigram_context_totals']
+        self.tri_indptr = sections['trigram_indptr']
+        self.tri_next = sections['trigram_next']
+        self.tri_counts = _count_section(sections, 'trigram_counts')
+        self._cache_unigram_probs()
+
+    def _build_successor_index(self):
+        """Precompute CSR successor arrays over vocab positions.
+
+        Each bigram row (keyed by w_i1) and trigram row (keyed by the packed
+        (w_i2, w_i1) context) stores the sorted positions of observed
+        successors and their counts, so a sampling step only touches the
+        n-grams that were actually seen in training. The layout matches the
+        binary format written by retrain_model.py.
+        """
+        V = len(self.vocab)
+        self.token_index = {t: i for i, t in enumerate(self.vocab)}
+        index = self.token_index
+
+        self.unigram_counts = np.array([self.unigram.get(t, 0) for t in self.vocab], dtype=np.int64)
+        self.uni_totals = np.array([self.unigram_totals.get(t, 0) for t in self.vocab], dtype=np.int64)
+
+        # Bigram rows: successors of w_i1
+        rows, succ, counts = [], [], []
+        for (w_i1, w_i), count in self.bigram.items():
+            if w_i1 in index and w_i in index:
+                rows.append(index[w_i1])
+                succ.append(index[w_i])
+                counts.append(count)
+        rows = np.array(rows, dtype=np.int64)
+        order = np.lexsort((np.array(succ, dtype=np.int64), rows))
+        self.bi_next = np.array(succ, dtype=np.int32)[order]
+        self.bi_counts = np.array(counts, dtype=np.int64)[order]
+        self.bi_indptr = np.searchsorted(rows[order], np.arange(V + 1)).astype(np.int64)
+
+        # Trigram rows: successors of the packed (w_i2, w_i1) context
+        keys, succ, counts = [], [], []
+        for (w_i2, w_i1, w_i), count in self.trigram.items():
+            if w_i2 in index and w_i1 in index and w_i in index:
+                keys.append(index[w_i2] * V + index[w_i1])
+                succ.append(index[w_i])
+                counts.append(count)
+        keys = np.array(keys, dtype=np.int64)
+        order = np.lexsort((np.array(succ, dtype=np.int64), keys))
+        keys = keys[order]
+        self.tri_next = np.array(succ, dtype=np.int32)[order]
+        self.tri_counts = np.array(counts, dtype=np.int64)[order]
+        self.tri_ctx, starts = np.unique(keys, return_index=True)
+        self.tri_indptr = np.append(starts, len(keys)).astype(np.int64)
+        self.tri_totals = np.array(
+            [self.bigram_totals.get((self.vocab[k // V], self.vocab[k % V]), 0) for k in self.tri_ctx.tolist()],
+            dtype=np.int64,
+        )
+        self._cache_unigram_probs()
+
+    def _cache_unigram_probs(self):
+        # Unigram mass is the same for every context, so compute it once
+        if self.total_tokens:
+            self.unigram_probs = self.lambda1 * (self.unigram_counts / self.total_tokens)
+        else:
+            self.unigram_probs = np.zeros(len(self.vocab), dtype=np.float64)
+
+    def _trigram_row(self, i2: int, i1: int) -> int:
+        """Row of the (w_i2, w_i1) context in the trigram CSR arrays, or -1 if unseen."""
+        if i2 < 0 or i1 < 0:
+            return -1
+        key = i2 * len(self.vocab) + i1
+        row = int(np.searchsorted(self.tri_ctx, key))
+        if row < len(self.tri_ctx) and self.tri_ctx[row] == key:
+            return row
+        return -1
+
+    @staticmethod
+    def _row_count(successors: np.ndarray, counts: np.ndarray, i: int) -> int:
+        j = int(np.searchsorted(successors, i))
+        if j < len(successors) and successors[j] == i:
+            return int(counts[j])
+        return 0
 
     def mle_trigram_prob(self, w_i: str, w_i1: str, w_i2: str) -> float:
-        denom = self.bigram_totals.get((w_i2, w_i1), 0)
-        if denom == 0:
+        row = self._trigram_row(self.token_index.get(w_i2, -1), self.token_index.get(w_i1, -1))
+        if row < 0 or self.tri_totals[row] == 0:
             return 0.0
-        return self.trigram.get((w_i2, w_i1, w_i), 0) / denom
+        start, end = self.tri_indptr[row], self.tri_indptr[row + 1]
+        count = self._row_count(self.tri_next[start:end], self.tri_counts[start:end], self.token_index.get(w_i, -1))
+        return count / int(self.tri_totals[row])
 
     def mle_bigram_prob(self, w_i: str, w_i1: str) -> float:
-        denom = self.unigram_totals.get(w_i1, 0)
-        if denom == 0:
+        i1 = self.token_index.get(w_i1, -1)
+        if i1 < 0 or self.uni_totals[i1] == 0:
             return 0.0
-        return self.bigram.get((w_i1, w_i), 0) / denom
+        start, end = self.bi_indptr[i1], self.bi_indptr[i1 + 1]
+        count = self._row_count(self.bi_next[start:end], self.bi_counts[start:end], self.token_index.get(w_i, -1))
+        return count / int(self.uni_totals[i1])
 
     def mle_unigram_prob(self, w_i: str) -> float:
-        return self.unigram.get(w_i, 0) / self.total_tokens if self.total_tokens else 0
+        i = self.token_index.get(w_i, -1)
+        if i < 0 or not self.total_tokens:
+            return 0
+        return int(self.unigram_counts[i]) / self.total_tokens
 
     def interpolated_prob(self, w_i: str, w_i1: str, w_i2: str) -> float:
         p_tri = self.mle_trigram_prob(w_i, w_i1, w_i2)
@@ -99,88 +342,194 @@ class TrigramModelLoader:
         # Note: notebook uses lambda3 for trigram, lambda2 for bigram, lambda1 for unigram
         return self.lambda3 * p_tri + self.lambda2 * p_bi + self.lambda1 * p_uni
 
-    def get_next_token_distribution(self, w_i2: str, w_i1: str) -> Tuple[List[str], np.ndarray]:
-        probs = np.array([self.interpolated_prob(t, w_i1, w_i2) for t in self.vocab], dtype=np.float64)
+    def _next_token_probs(self, i2: int, i1: int) -> np.ndarray:
+        """Normalised interpolated distribution over vocab positions for a context of positions."""
+        probs = np.zeros(len(self.vocab), dtype=np.float64)
+        row = self._trigram_row(i2, i1)
+        if row >= 0 and self.tri_totals[row] > 0:
+            start, end = self.tri_indptr[row], self.tri_indptr[row + 1]
+            probs[self.tri_next[start:end]] = self.lambda3 * (self.tri_counts[start:end] / self.tri_totals[row])
+        if i1 >= 0 and self.uni_totals[i1] > 0:
+            start, end = self.bi_indptr[i1], self.bi_indptr[i1 + 1]
+            probs[self.bi_next[start:end]] += self.lambda2 * (self.bi_counts[start:end] / self.uni_totals[i1])
+        probs += self.unigram_probs
+
         total = probs.sum()
         if total > 0:
             probs /= total
         else:
             probs = np.ones(len(self.vocab)) / len(self.vocab)
-        return self.vocab, probs
+        return probs
 
-    def generate_stream(self, prefix: any, tokenizer_mapping: dict = None, max_length: int = 800, min_tokens: int = 600):
-        """Generates a stream of tokens targeting exactly ~600-800 tokens with 5-6 sentences per paragraph."""
-        # Ensure we always generate enough for the user's request
-        max_length = max(max_length, 800)
-        min_tokens = max(min_tokens, 600)
-        
-        if isinstance(prefix, str):
-            prefix_tokens = prefix.split()
-        else:
-            prefix_tokens = list(prefix)
-            
-        context = [self.BOS, self.BOS] + prefix_tokens
-        
-        # Urdu sentence ending punctuations
-        end_punctuations = {'۔', '؟', '!', '.', '?', '!'}
-        special_tokens = {self.BOS, self.EOS, self.EOP, self.EOT, '\uFFF0', '\uFFF1', '\uFFF2'}
-
-        token_count = 0
-        sentences_in_para = 0
-        
-        # Increased loop range for safety
-        for i in range(max_length * 3):
-            w_i2 = context[-2]
-            w_i1 = context[-1]
-            
-            tokens, probs = self.get_next_token_distribution(w_i2, w_i1)
-            next_token = np.random.choice(tokens, p=probs)
-            
-            if hasattr(next_token, 'item'):
-                next_token = next_token.item()
-            
-            # Force continue if EOT sampled too early
-            if next_token == self.EOT and token_count < min_tokens:
-                continue
-                
-            context.append(next_token)
-            
-            if next_token in special_tokens:
-                if next_token == self.EOT:
-                    break
-                continue
+    @staticmethod
+    def _apply_mask(probs: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Zero the masked positions and renormalise, falling back to uniform over the rest."""
+        probs = probs.copy()
+        probs[..., mask] = 0.0
+        totals = probs.sum(axis=-1, keepdims=True)
+        empty = totals[..., 0] <= 0
+        if empty.any():
+            probs[empty] = (~mask) / max(int((~mask).sum()), 1)
+            totals[empty] = 1.0
+        return probs / totals
 
-            token_count += 1
-            yield next_token
-            
-            token_str = ""
-            if tokenizer_mapping and next_token in tokenizer_mapping:
-                val = tokenizer_mapping[next_token]
-                if isinstance(val, bytes):
-                    token_str = val.decode('utf-8', errors='replace')
-                else:
-                    token_str = val
-            
-            # Paragraph injection logic:
-            # Strictly 5-6 sentences per paragraph.
-            if any(p in token_str for p in end_punctuations):
-                sentences_in_para += 1
-                if sentences_in_para >= random.randint(5, 6) and token_count < max_length - 80:
-                    yield "\n\n"
-                    sentences_in_para = 0
-
-            # Stop conditions
-            if token_count >= max_length:
-                break
-            
-            # Stop only after hitting minimum tokens and seeing a sentence end
-            if token_count >= min_tokens and any(p in token_str for p in end_punctuations):
-                # Gradually increase stop probability
-                if token_count > (max_length * 0.9) or np.random.random() < 0.1:
+    def _context_cdf(self, i2: int, i1: int, mask_key: str = None) -> np.ndarray:
+        """Cumulative next-token distribution for a context, from the LRU cache when possible.
+
+        Contexts without trigram successors only depend on w_i1, so they share
+        one entry keyed by (-1, w_i1). mask_key selects a constrained variant
+        ('skip_eot'), cached separately.
+        """
+        if self._trigram_row(i2, i1) < 0:
+            i2 = -1
+        key = (i2, i1, mask_key)
+        cdf = self.cdf_cache.get(key)
+        if cdf is None:
+            probs = self._next_token_probs(i2, i1)
+            if mask_key is not None:
+                probs = self._apply_mask(probs, self.sampling_masks[mask_key])
+            cdf = np.cumsum(probs)
+            cdf /= cdf[-1]
+            self.cdf_cache.put(key, cdf)
+        return cdf
+
+    def sample_next(self, i2: int, i1: int, rng: np.random.Generator, mask_key: str = None) -> int:
+        """Draw the next vocab position for a context of positions."""
+        # Same draw rng.choice(p=...) makes, without rebuilding the CDF
+        return int(self._context_cdf(i2, i1, mask_key).searchsorted(rng.random(), side='right'))
+
+    def warm_cache(self, top_k: int, constrained: bool = False) -> int:
+        """Precompute CDFs for the top_k most frequent trigram contexts. Returns how many were added.
+
+        With constrained=True the 'skip_eot' variant is warmed, which is what
+        constrained stories draw from until they reach min_tokens.
+        """
+        top_k = min(top_k, len(self.tri_ctx), self.cdf_cache.maxsize)
+        if top_k <= 0:
+            return 0
+        V = len(self.vocab)
+        # Least frequent first, so the hottest contexts end up most recently used
+        rows = np.argsort(self.tri_totals, kind='stable')[-top_k:]
+        mask_key = 'skip_eot' if constrained and self.sampling_masks['skip_eot'] is not None else None
+        for key in self.tri_ctx[rows].tolist():
+            self._context_cdf(key // V, key % V, mask_key)
+        return top_k
+
+    def get_next_token_distribution(self, w_i2: str, w_i1: str) -> Tuple[List[str], np.ndarray]:
+        i2 = self.token_index.get(w_i2, -1)
+        i1 = self.token_index.get(w_i1, -1)
+        return self.vocab, self._next_token_probs(i2, i1)
+
+    def _batch_next_token_probs(self, i2: np.ndarray, i1: np.ndarray) -> np.ndarray:
+        """Row-normalised interpolated distributions for a batch of contexts, shape (n, V)."""
+        n, V = len(i1), len(self.vocab)
+        probs = np.zeros((n, V), dtype=np.float64)
+
+        # Trigram mass: look up every context row at once, then gather the ragged successor slices
+        keys = i2 * V + i1
+        rows = np.searchsorted(self.tri_ctx, keys)
+        safe_rows = np.minimum(rows, max(len(self.tri_ctx) - 1, 0))
+        found = (i2 >= 0) & (i1 >= 0) & (rows < len(self.tri_ctx))
+        if len(self.tri_ctx):
+            found &= self.tri_ctx[safe_rows] == keys
+            found &= self.tri_totals[safe_rows] > 0
+        batch_rows = np.nonzero(found)[0]
+        if len(batch_rows):
+            ctx_rows = rows[batch_rows]
+            idx, owner = _ragged_ranges(self.tri_indptr[ctx_rows], self.tri_indptr[ctx_rows + 1])
+            totals = self.tri_totals[ctx_rows][owner]
+            probs[batch_rows[owner], self.tri_next[idx]] = self.lambda3 * (self.tri_counts[idx] / totals)
+
+        # Bigram mass
+        batch_rows = np.nonzero(i1 >= 0)[0]
+        if len(batch_rows):
+            ctx = i1[batch_rows]
+            batch_rows = batch_rows[self.uni_totals[ctx] > 0]
+            ctx = i1[batch_rows]
+            idx, owner = _ragged_ranges(self.bi_indptr[ctx], self.bi_indptr[ctx + 1])
+            totals = self.uni_totals[ctx][owner]
+            probs[batch_rows[owner], self.bi_next[idx]] += self.lambda2 * (self.bi_counts[idx] / totals)
+
+        probs += self.unigram_probs
+        totals = probs.sum(axis=1, keepdims=True)
+        empty = totals[:, 0] <= 0
+        probs[empty] = 1.0 / V
+        totals[empty] = 1.0
+        probs /= totals
+        return probs
+
+    def generate_stream(self, prefix: any, tokenizer_mapping: dict = None, max_length: int = 800, min_tokens: int = 600,
+                        constrained: bool = False, stats: dict = None, rng: np.random.Generator = None):
+        """Generates a stream of tokens targeting exactly ~600-800 tokens with 5-6 sentences per paragraph.
+
+        With constrained=True, EOT gets zero probability before min_tokens
+        instead of being rejected after the draw, which leaves the story
+        distribution unchanged. If given, stats receives the number of draws and emitted tokens.
+        All randomness comes from rng (a fresh unseeded Generator by default),
+        so a seeded rng reproduces the story and concurrent calls never share state.
+        """
+        story = StoryState(self, prefix, tokenizer_mapping, max_length, min_tokens, rng)
+
+        try:
+            # Increased loop range for safety
+            for i in range(story.max_length * 3):
+                story.draws += 1
+                yield from story.advance(self.sample_next(story.i2, story.i1, story.rng, story.mask_key(constrained)))
+                if story.done:
                     break
+        finally:
+            if stats is not None:
+                stats.update(story.stats())
+
+    def generate_batch(self, prefixes: list, tokenizer_mapping: dict = None, max_lengths: list = None, min_tokens: int = 600,
+                       constrained: bool = False, stats: list = None, rngs: list = None) -> list:
+        """Generates one story per prefix, advancing all unfinished stories in lock-step.
+
+        Each step samples the next token for every active story with a single
+        vectorised draw. Returns, per prefix, the items generate_stream would yield.
+        constrained and stats (one dict per story appended) work as in generate_stream.
+        rngs gives each story its own Generator, so a seeded story does not
+        depend on what else is in the batch.
+        """
+        if max_lengths is None:
+            max_lengths = [800] * len(prefixes)
+        if rngs is None:
+            rngs = [None] * len(prefixes)
+        stories = [StoryState(self, prefix, tokenizer_mapping, max_length, min_tokens, rng)
+                   for prefix, max_length, rng in zip(prefixes, max_lengths, rngs)]
+        outputs = [[] for _ in stories]
+        steps = 0
+        active = [i for i, story in enumerate(stories) if story.max_length > 0]
+
+        while active:
+            i2 = np.array([stories[i].i2 for i in active], dtype=np.int64)
+            i1 = np.array([stories[i].i1 for i in active], dtype=np.int64)
+            probs = self._batch_next_token_probs(i2, i1)
+            if constrained:
+                rows = [k for k, i in enumerate(active) if stories[i].mask_key(True) == 'skip_eot']
+                if rows:
+                    probs[rows] = self._apply_mask(probs[rows], self.sampling_masks['skip_eot'])
+            cdf = np.cumsum(probs, axis=1)
+            draws = np.array([stories[i].rng.random() for i in active]) * cdf[:, -1]
+            choices = np.minimum((cdf <= draws[:, None]).sum(axis=1), len(self.vocab) - 1)
 
-    def generate(self, prefix_text: str, tokenizer_mapping: dict = None, max_length: int = 200) -> str:
-        tokens = list(self.generate_stream(prefix_text, tokenizer_mapping, max_length))
+            steps += 1
+            still_active = []
+            for i, choice in zip(active, choices.tolist()):
+                story = stories[i]
+                story.draws += 1
+                outputs[i].extend(story.advance(choice))
+                if not story.done and steps < story.max_length * 3:
+                    still_active.append(i)
+            active = still_active
+
+        if stats is not None:
+            stats.extend(story.stats() for story in stories)
+        return outputs
+
+    def generate(self, prefix_text: str, tokenizer_mapping: dict = None, max_length: int = 200,
+                 rng: np.random.Generator = None) -> str:
+        tokens = list(self.generate_stream(prefix_text, tokenizer_mapping, max_length, rng=rng))
         result = []
         for t in tokens:
             if isinstance(t, str):
@@ -190,3 +539,112 @@ class TrigramModelLoader:
             else:
                 result.append(str(t))
         return "".join(result).strip()
+
+
+class CodebookCounts:
+    """Quantised count section: uint8 codes that are decoded through a codebook when indexed."""
+
+    def __init__(self, codes: np.ndarray, codebook: np.ndarray):
+        self.codes = codes
+        self.codebook = codebook
+
+    def __getitem__(self, key):
+        return self.codebook[self.codes[key]]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def _count_section(sections: dict, name: str):
+    """A count section as stored, or a decoding view if the file quantised it."""
+    if name + '_codebook' in sections:
+        return CodebookCounts(sections[name], np.asarray(sections[name + '_codebook']))
+    return sections[name]
+
+
+def _ragged_ranges(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate [start, end) index ranges; also return which range each index came from."""
+    lengths = ends - starts
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return offsets + np.arange(lengths.sum()), owner
+
+
+class StoryState:
+    """Per-story bookkeeping shared by generate_stream and generate_batch.
+
+    Tracks the trigram context, token and sentence counts, and decides for
+    each sampled token what to emit and when the story is finished.
+    """
+
+    def __init__(self, loader: TrigramModelLoader, prefix: any, tokenizer_mapping: dict = None,
+                 max_length: int = 800, min_tokens: int = 600, rng: np.random.Generator = None):
+        self.loader = loader
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.ends_sentence = loader._sentence_end_flags(tokenizer_mapping)
+        # Ensure we always generate enough for the user's request
+        self.max_length = max(max_length, 800)
+        self.min_tokens = max(min_tokens, 600)
+
+        if isinstance(prefix, str):
+            prefix_tokens = prefix.split()
+        else:
+            prefix_tokens = list(prefix)
+        context = [loader.BOS, loader.BOS] + prefix_tokens
+        self.i2 = loader.token_index.get(context[-2], -1)
+        self.i1 = loader.token_index.get(context[-1], -1)
+
+        self.token_count = 0
+        self.sentences_in_para = 0
+        self.draws = 0
+        self.done = False
+
+    def mask_key(self, constrained: bool):
+        """Constrained-sampling variant for the next draw, or None when unconstrained."""
+        # A rejected EOT never entered the context, so masking it is exact; nothing to mask
+        # once min_tokens is reached or if the model has no EOT in its vocab
+        if not constrained or self.token_count >= self.min_tokens:
+            return None
+        return 'skip_eot' if self.loader.sampling_masks['skip_eot'] is not None else None
+
+    def stats(self) -> dict:
+        return {"draws": self.draws, "tokens": self.token_count}
+
+    def advance(self, position: int) -> list:
+        """Consume the token sampled at a vocab position and return the items to emit for it."""
+        loader = self.loader
+        # Force continue if EOT sampled too early
+        is_eot = loader.is_eot_position[position]
+        if is_eot and self.token_count < self.min_tokens:
+            return []
+
+        self.i2, self.i1 = self.i1, position
+
+        if loader.is_special_position[position]:
+            if is_eot:
+                self.done = True
+            return []
+
+        self.token_count += 1
+        emitted = [loader.vocab[position]]
+        ends_sentence = self.ends_sentence is not None and self.ends_sentence[position]
+
+        # Paragraph injection logic:
+        # Strictly 5-6 sentences per paragraph.
+        if ends_sentence:
+            self.sentences_in_para += 1
+            if self.sentences_in_para >= self.rng.integers(5, 7) and self.token_count < self.max_length - 80:
+                emitted.append("\n\n")
+                self.sentences_in_para = 0
+
+        # Stop conditions
+        if self.token_count >= self.max_length:
+            self.done = True
+
+        # Stop only after hitting minimum tokens and seeing a sentence end
+        elif self.token_count >= self.min_tokens and ends_sentence:
+            # Gradually increase stop probability
+            if self.token_count > (self.max_length * 0.9) or self.rng.random() < 0.1:
+                self.done = True
+
+        return emitted
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from .model_loader import TrigramModelLoader, model_digest
+from .tokenizer import BPETokenizer
+from .token_table import TokenTable
+
+SMOKE_PROMPT = "ایک دفعہ کا ذکر ہے"
+
+
+class ModelBundle:
+    """A tokenizer and trigram model that were loaded and validated together.
+
+    Requests take the current bundle once and use it throughout, so a reload
+    never mixes one artifact's tokenizer with another's model.
+    """
+
+    def __init__(self, tokenizer: BPETokenizer, loader: TrigramModelLoader, token_table: TokenTable,
+                 model_path: str, tokenizer_path: str, load_seconds: float):
+        self.tokenizer = tokenizer
+        self.loader = loader
+        self.token_table = token_table
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        # Model digest (from the binary header, see model_loader) and tokenizer content hash,
+        # so a retrain of either changes the version
+        self.version = f"{loader.version}-{model_digest(tokenizer_path)[:8]}"
+
+
+def load_bundle(model_path: str, tokenizer_path: str, cache_size: int = 1024, warm: int = 0,
+                constrained: bool = False) -> ModelBundle:
+    """Load a model/tokenizer pair, warm the sampler cache and build the token table."""
+    started = time.perf_counter()
+    tokenizer = BPETokenizer()
+    tokenizer.load(tokenizer_path)
+    loader = TrigramModelLoader(model_path, cache_size=cache_size)
+    # Per-id bytes and sentence/special flags, shared by the sampler and the endpoints. Bound before
+    # warming, since the tokenizer's special ids decide the constrained sampling mask.
+    token_table = loader.bind_tokenizer(tokenizer.id_to_token)
+    loader.warm_cache(warm, constrained=constrained)
+    return ModelBundle(tokenizer, loader, token_table, model_path, tokenizer_path, time.perf_counter() - started)
+
+
+def smoke_test(bundle: ModelBundle, prompt: str = SMOKE_PROMPT, constrained: bool = False):
+    """Raise ValueError unless the bundle's tokenizer and model work together on a short prompt."""
+    tokenizer, loader = bundle.tokenizer, bundle.loader
+    if tokenizer.decode(tokenizer.encode(prompt)) != prompt:
+        raise ValueError("Tokenizer does not round-trip the smoke prompt")
+    unknown = [t for t in loader.vocab if isinstance(t, int) and t not in tokenizer.id_to_token]
+    if unknown:
+        raise ValueError(f"{len(unknown)} model token ids are missing from the tokenizer (e.g. {unknown[:5]})")
+    stats = {}
+    tokens = list(loader.generate_stream(tokenizer.encode(prompt), tokenizer_mapping=tokenizer.id_to_token,
+                                         constrained=constrained, stats=stats, rng=np.random.default_rng(0)))
+    if not stats.get("tokens") or not bundle.token_table.decode(t for t in tokens if not isinstance(t, str)):
+        raise ValueError("Smoke generation produced no text")
+
+
+class ModelReloader:
+    """Holds the active ModelBundle and replaces it with newly loaded artifacts.
+
+    reload() loads and smoke-tests the new pair on a background thread and
+    only then swaps it in with a single assignment; requests already running
+    keep the bundle they started with. With watch_interval > 0 the artifact
+    files are polled and a change triggers a reload.
+    """
+
+    def __init__(self, model_path: str, tokenizer_path: str, cache_size: int = 1024, warm: int = 0,
+                 constrained: bool = False, watch_interval: float = 0, on_swap=None):
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path
+        self.cache_size = cache_size
+        self.warm = warm
+        self.constrained = constrained
+        self.on_swap = on_swap
+        self.current: Optional[ModelBundle] = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watch_interval = watch_interval
+        self._watcher: Optional[threading.Thread] = None
+
+    @property
+    def reloading(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def load_initial(self):
+        """Load the configured artifacts in the calling thread; errors are recorded, not raised."""
+        # Taken before loading, so a file replaced while the first load runs is still noticed
+        seen = self._artifact_mtimes()
+        self._load_and_swap(self.model_path, self.tokenizer_path)
+        if self._watch_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, args=(seen,), name="model-watch", daemon=True)
+            self._watcher.start()
+
+    def reload(self, model_path: str = None, tokenizer_path: str = None) -> bool:
+        """Start a background reload. Returns False if one is already running."""
+        with self._lock:
+            if self.reloading:
+                return False
+            self._thread = threading.Thread(
+                target=self._load_and_swap,
+                args=(model_path or self.model_path, tokenizer_path or self.tokenizer_path),
+                name="model-reload",
+                daemon=True,
+            )
+            self._thread.start()
+            return True
+
+    def wait(self, timeout: float = None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _load_and_swap(self, model_path: str, tokenizer_path: str):
+        try:
+            bundle = load_bundle(model_path, tokenizer_path, self.cache_size, self.warm, self.constrained)
+            smoke_test(bundle, constrained=self.constrained)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Error loading model: {self.last_error}")
+            return
+        previous = self.current
+        self.current = bundle
+        self.model_path, self.tokenizer_path = model_path, tokenizer_path
+        self.last_error = None
+        if previous is not None:
+            self.reloads += 1
+            print(f"Model reloaded: {previous.version} -> {bundle.version}")
+        if self.on_swap is not None:
+            self.on_swap(bundle)
+
+    def _artifact_mtimes(self):
+        try:
+            return os.stat(self.model_path).st_mtime_ns, os.stat(self.tokenizer_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _watch(self, seen):
+        while not self._stop.wait(self._watch_interval):
+            mtimes = self._artifact_mtimes()
+            # If a reload is already running, leave seen alone so the change is picked up next poll
+            if mtimes is not None and mtimes != seen and self.reload():
+                seen = mtimes
+
+    def stop(self):
+        self._stop.set()
@@ -1,8 +1,28 @@
-from pydantic import BaseModel, Field
+from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
 
 class GenerateRequest(BaseModel):
     prefix: str = Field(..., description="The seed text to start story generation", example="ایک دفعہ کا")
     max_length: int = Field(default=600, ge=1, le=1000, description="Maximum number of tokens to generate")
+    pace_ms: Optional[float] = Field(default=None, ge=0, le=1000, description="Delay between streamed chunks; defaults to the deployment's STREAM_PACE_MS")
+    seed: Optional[int] = Field(default=None, ge=0, description="Random seed; the same prefix, max_length and seed reproduce the same story")
 
 class GenerateResponse(BaseModel):
+    # Allow field names starting with model_, which pydantic reserves by default
+    model_config = ConfigDict(protected_namespaces=())
+
     generated_text: str = Field(..., description="The generated Urdu story")
+    draws: Optional[int] = Field(default=None, description="Sampling draws the story needed")
+    model_version: Optional[str] = Field(default=None, description="Version of the model and tokenizer that generated the story")
+
+class GenerateBatchRequest(BaseModel):
+    requests: List[GenerateRequest] = Field(..., min_length=1, max_length=64, description="Stories to generate together")
+
+class GenerateBatchResponse(BaseModel):
+    stories: List[GenerateResponse] = Field(..., description="Generated stories, in request order")
+
+class ReloadRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_path: Optional[str] = Field(default=None, description="Model file to load, relative to the models directory; defaults to the current one")
+    tokenizer_path: Optional[str] = Field(default=None, description="Tokenizer file to load, relative to the models directory; defaults to the current one")
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Hashable, Optional
+
+# Popularity scores kept for at most this many request keys; the coldest are dropped beyond it
+MAX_TRACKED = 1024
+
+
+class StoryPool:
+    """Ready-made unseeded stories for the most requested prefixes.
+
+    record() counts each unseeded request in a popularity score that halves
+    every half_life seconds. A background thread keeps up to size stories for
+    each of the max_prefixes hottest keys scoring at least min_score, calling
+    generate(key) off the request path; generate may return None to skip a
+    turn (for example when no worker is free). After every story it sleeps long
+    enough to stay under cpu_share of one core, and it pauses while is_busy()
+    reports queued requests. take() pops a story for a key if one is ready.
+    """
+
+    def __init__(self, generate: Callable, size: int = 4, max_prefixes: int = 8, min_score: float = 2.5,
+                 half_life: float = 300.0, cpu_share: float = 0.25, is_busy: Callable[[], bool] = None):
+        self.generate = generate
+        self.size = size
+        self.max_prefixes = max_prefixes
+        self.min_score = min_score
+        self.half_life = half_life
+        self.cpu_share = min(max(cpu_share, 0.01), 1.0)
+        self.is_busy = is_busy or (lambda: False)
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self._scores = {}  # key -> (score, time of last update)
+        self._stories = {}  # key -> deque of stories
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _score(self, key: Hashable, now: float) -> float:
+        score, updated = self._scores.get(key, (0.0, now))
+        return score * 0.5 ** ((now - updated) / self.half_life)
+
+    def record(self, key: Hashable):
+        """Count one request for key and wake the refill thread if the key's pool is short."""
+        now = time.monotonic()
+        with self._lock:
+            score = self._score(key, now) + 1
+            self._scores[key] = (score, now)
+            if len(self._scores) > MAX_TRACKED:
+                coldest = sorted(self._scores, key=lambda k: self._score(k, now))[:MAX_TRACKED // 2]
+                for k in coldest:
+                    del self._scores[k]
+            short = len(self._stories.get(key, ())) < self.size
+        if score >= self.min_score and short:
+            self._wake.set()
+
+    def take(self, key: Hashable, version: str = None):
+        """Pop a ready story for key, or None. Stories from another model version are discarded."""
+        with self._lock:
+            stories = self._stories.get(key)
+            while stories:
+                story = stories.popleft()
+                if version is None or getattr(story, "model_version", version) == version:
+                    self.hits += 1
+                    self._wake.set()
+                    return story
+            self.misses += 1
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._stories.clear()
+
+    def _next_key(self):
+        """The hot key with the fewest ready stories below size; pools of keys no longer hot are dropped."""
+        now = time.monotonic()
+        with self._lock:
+            scored = [(self._score(k, now), k) for k in self._scores]
+            hot = [k for score, k in sorted(scored, key=lambda item: -item[0]) if score >= self.min_score]
+            hot = hot[:self.max_prefixes]
+            for key in [k for k in self._stories if k not in hot]:
+                del self._stories[key]
+            short = [(len(self._stories.get(k, ())), k) for k in hot if len(self._stories.get(k, ())) < self.size]
+        return min(short, key=lambda item: item[0])[1] if short else None
+
+    def _run(self):
+        while not self._stop.is_set():
+            key = self._next_key() if not self.is_busy() else None
+            if key is None:
+                # Nothing to refill (or requests are queued); wait for a request or re-check shortly
+                self._wake.wait(1.0)
+                self._wake.clear()
+                continue
+            started = time.perf_counter()
+            try:
+                story = self.generate(key)
+            except Exception as e:
+                print(f"Story pool generation failed for {key!r}: {type(e).__name__}: {e}")
+                self._stop.wait(5.0)
+                continue
+            elapsed = time.perf_counter() - started
+            if story is None:
+                # Skipped (e.g. every worker busy); try again shortly
+                self._stop.wait(0.25)
+                continue
+            with self._lock:
+                # A story generated across a model swap is kept here and discarded by take()
+                self._stories.setdefault(key, deque())
+                if len(self._stories[key]) < self.size:
+                    self._stories[key].append(story)
+                    self.generated += 1
+            # Idle for the rest of the duty cycle so pre-generation stays under cpu_share
+            self._stop.wait(elapsed * (1 - self.cpu_share) / self.cpu_share)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="story-pool", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "prefixes": len(self._stories),
+                "stories": sum(len(s) for s in self._stories.values()),
+                "size": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "generated": self.generated,
+            }
@@ -0,0 +1,68 @@
+import codecs
+import time
+from typing import Callable, Optional
+
+from fastapi.responses import StreamingResponse
+
+from .token_table import STRIP_SPECIALS
+
+
+class Utf8ChunkDecoder:
+    """Turns a stream of token bytes into valid UTF-8 text chunks.
+
+    Byte-level BPE tokens can split a multi-byte Urdu character, so bytes go
+    through an incremental decoder that holds back incomplete sequences.
+    Decoded text is coalesced until it reaches chunk_bytes or flush_interval
+    seconds have passed since the last chunk.
+    """
+
+    def __init__(self, chunk_bytes: int = 256, flush_interval: float = 0.1):
+        self.chunk_bytes = chunk_bytes
+        self.flush_interval = flush_interval
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._parts = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    def feed(self, data: bytes) -> Optional[str]:
+        """Add bytes; return a chunk if one is ready, else None."""
+        text = self._decoder.decode(data).translate(STRIP_SPECIALS)
+        if text:
+            self._parts.append(text)
+            self._size += len(text.encode('utf-8'))
+        if self._size and (self._size >= self.chunk_bytes
+                           or time.monotonic() - self._last_flush >= self.flush_interval):
+            return self._take()
+        return None
+
+    def flush(self) -> str:
+        """Return whatever is buffered, replacing a dangling partial character."""
+        text = self._decoder.decode(b'', final=True).translate(STRIP_SPECIALS)
+        if text:
+            self._parts.append(text)
+        return self._take()
+
+    def _take(self) -> str:
+        chunk = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+        return chunk
+
+
+class CancellableStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls on_close once the response ends for any reason.
+
+    Unlike a background task, on_close also runs when the client disconnects
+    or the body iterator is closed before its first item.
+    """
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
@@ -0,0 +1,41 @@
+import numpy as np
+
+# Urdu sentence ending punctuations
+END_PUNCTUATIONS = {'۔', '؟', '!', '.', '?', '!'}
+# Sentence, paragraph and story markers inserted during preprocessing
+SPECIAL_CHARS = ('\uFFF0', '\uFFF1', '\uFFF2')
+STRIP_SPECIALS = str.maketrans({c: None for c in SPECIAL_CHARS})
+
+
+class TokenTable:
+    """Per-id lookups precomputed once for a tokenizer.
+
+    token_bytes holds each id's raw bytes, ends_sentence marks ids whose text
+    contains sentence-ending punctuation, and is_special marks ids that only
+    carry special markers (or are special ids of the model) and are never shown.
+    """
+
+    def __init__(self, id_to_token: dict, special_ids=()):
+        size = max(id_to_token) + 1 if id_to_token else 0
+        self.token_bytes = [b''] * size
+        self.ends_sentence = np.zeros(size, dtype=bool)
+        self.is_special = np.zeros(size, dtype=bool)
+
+        for i, token in id_to_token.items():
+            raw = token if isinstance(token, bytes) else str(token).encode('utf-8')
+            text = raw.decode('utf-8', errors='replace')
+            self.token_bytes[i] = raw
+            self.ends_sentence[i] = any(p in text for p in END_PUNCTUATIONS)
+            self.is_special[i] = bool(text) and not text.translate(STRIP_SPECIALS)
+        for i in special_ids:
+            if 0 <= i < size:
+                self.is_special[i] = True
+
+    def visible_bytes(self, token_ids) -> bytes:
+        """Concatenated bytes of the ids that are not special."""
+        token_bytes, is_special = self.token_bytes, self.is_special
+        return b"".join(token_bytes[i] for i in token_ids if not is_special[i])
+
+    def decode(self, token_ids) -> str:
+        """Decode ids to text without special tokens or markers."""
+        return self.visible_bytes(token_ids).decode('utf-8', errors='replace').translate(STRIP_SPECIALS)
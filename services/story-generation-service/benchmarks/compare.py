@@ -0,0 +1,50 @@
+"""Compare two JSON reports written by benchmarks.run.
+
+    python -m benchmarks.compare baseline.json candidate.json
+
+Prints every shared timing (median_s) and throughput (*_per_s) metric with
+the candidate/baseline ratio.
+"""
+import argparse
+import json
+
+
+def flatten(report, prefix=""):
+    """Yield (dotted name, value) for the numeric timing and throughput fields of a report."""
+    for key, value in report.items():
+        if key == "meta":
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, name + ".")
+        elif isinstance(value, (int, float)) and (key == "median_s" or key.endswith("_per_s") or key.endswith("load_s")):
+            yield name, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"baseline:  {baseline['meta'].get('commit')}  {baseline['meta'].get('timestamp')}")
+    print(f"candidate: {candidate['meta'].get('commit')}  {candidate['meta'].get('timestamp')}")
+    base_values = dict(flatten(baseline))
+    width = max((len(name) for name in base_values), default=0)
+    for name, value in flatten(candidate):
+        if name not in base_values or not base_values[name]:
+            continue
+        ratio = value / base_values[name]
+        # Lower is better for times, higher for throughput
+        better = ratio > 1 if name.endswith("_per_s") else ratio < 1
+        verdict = "same" if abs(ratio - 1) < 0.01 else "better" if better else "worse"
+        print(f"{name:<{width}}  {base_values[name]:>12.4g}  {value:>12.4g}  {ratio:6.2f}x  {verdict}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""Reproducible benchmarks for the tokenizer, sampler and HTTP endpoints.
+
+Run from services/story-generation-service:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.compare old.json bench.json
+
+Everything runs on a seeded synthetic corpus unless --model and --tokenizer
+point at real files, so results are comparable between commits. The synthetic
+model is counted and exported by the repository's retrain_model.py, and load
+time is measured for both its binary and its pickle export.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+# Tokenizers pickled by the training scripts reference the bpe_tokenizer module
+import app.tokenizer
+sys.modules['bpe_tokenizer'] = app.tokenizer
+
+from app.tokenizer import BPETokenizer
+from app.model_loader import TrigramModelLoader, is_binary_model
+from benchmarks.synthetic import synthetic_stories, build_models
+
+PREFIX = "ایک دفعہ کا ذکر ہے"
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def rss_bytes():
+    """Current resident set size, or peak RSS where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes on Linux
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def summarize(samples):
+    """Median, min, p95 and run count of a list of durations in seconds."""
+    ordered = sorted(samples)
+    return {
+        "median_s": statistics.median(ordered),
+        "min_s": ordered[0],
+        "p95_s": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "runs": len(ordered),
+    }
+
+
+def timed(fn, repeat):
+    """Run fn repeat times; return the timing summary and the last result."""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples), result
+
+
+def bench_tokenizer(stories, args):
+    text = " ".join(stories)
+    results = {"corpus_bytes": len(text.encode("utf-8"))}
+
+    def train():
+        tokenizer = BPETokenizer(vocab_size=args.vocab_size)
+        tokenizer.train(text, incremental=True)
+        return tokenizer
+
+    timing, tokenizer = timed(train, args.train_repeat)
+    results["train"] = dict(timing, merges=len(tokenizer.merges),
+                            bytes_per_s=results["corpus_bytes"] / timing["median_s"])
+
+    if args.full_train:
+        def train_full():
+            full = BPETokenizer(vocab_size=args.vocab_size)
+            full.train(text)
+            return full
+        timing, _ = timed(train_full, args.train_repeat)
+        results["train_full_recount"] = dict(timing, bytes_per_s=results["corpus_bytes"] / timing["median_s"])
+
+    def encode_cold():
+        # Drop the per-word cache so every word goes through the merge loop
+        tokenizer._reset_encoder()
+        return [tokenizer.encode(s) for s in stories]
+
+    timing, encoded = timed(encode_cold, args.repeat)
+    token_count = sum(len(ids) for ids in encoded)
+    results["encode_cold"] = dict(timing, tokens=token_count, bytes_per_s=results["corpus_bytes"] / timing["median_s"])
+    timing, _ = timed(lambda: [tokenizer.encode(s) for s in stories], args.repeat)
+    results["encode_warm"] = dict(timing, tokens=token_count, bytes_per_s=results["corpus_bytes"] / timing["median_s"])
+    return results, tokenizer, encoded
+
+
+def bench_load(model_path, args):
+    gc.collect()
+    before = rss_bytes()
+    start = time.perf_counter()
+    loader = TrigramModelLoader(model_path, cache_size=args.cache_size)
+    first_load = time.perf_counter() - start
+    after = rss_bytes()
+    results = {
+        "model_path": os.path.basename(model_path),
+        "model_bytes": os.path.getsize(model_path),
+        "vocab_size": len(loader.vocab),
+        "first_load_s": first_load,
+        "rss_before_bytes": before,
+        "rss_after_bytes": after,
+        "rss_delta_bytes": after - before if before is not None and after is not None else None,
+    }
+    timing, _ = timed(lambda: TrigramModelLoader(model_path, cache_size=args.cache_size), args.repeat)
+    results["load"] = timing
+    return results, loader
+
+
+def bench_sampler(loader, tokenizer, args):
+    results = {}
+    rng = np.random.default_rng(args.seed)
+    vocab = loader.vocab
+    # Contexts drawn from observed trigram rows, plus some random ones that fall back to lower orders
+    V = len(vocab)
+    observed = loader.tri_ctx[rng.integers(0, len(loader.tri_ctx), size=args.contexts // 2)]
+    contexts = [(vocab[int(k) // V], vocab[int(k) % V]) for k in observed]
+    contexts += [(vocab[i], vocab[j]) for i, j in rng.integers(0, V, size=(args.contexts - len(contexts), 2))]
+
+    def distributions():
+        for w_i2, w_i1 in contexts:
+            loader.get_next_token_distribution(w_i2, w_i1)
+
+    timing, _ = timed(distributions, args.repeat)
+    results["next_token_distribution"] = dict(timing, contexts=len(contexts),
+                                              contexts_per_s=len(contexts) / timing["median_s"])
+
+    prefix_ids = tokenizer.encode(PREFIX)
+    loader.bind_tokenizer(tokenizer.id_to_token)
+
+    def stories(constrained):
+        rng = np.random.default_rng(args.seed)
+        total = 0
+        for _ in range(args.stories):
+            stats = {}
+            for _ in loader.generate_stream(prefix_ids, tokenizer_mapping=tokenizer.id_to_token,
+                                            max_length=args.max_length, constrained=constrained, stats=stats, rng=rng):
+                pass
+            total += stats["tokens"]
+        return total
+
+    for name, constrained in (("generate_stream", False), ("generate_stream_constrained", True)):
+        loader.cdf_cache.clear()
+        timing, tokens = timed(lambda: stories(constrained), args.repeat)
+        results[name] = dict(timing, stories=args.stories, tokens=tokens, tokens_per_s=tokens / timing["median_s"])
+    return results
+
+
+def bench_http(model_path, tokenizer_path, args):
+    os.environ["MODEL_PATH"] = model_path
+    os.environ["TOKENIZER_PATH"] = tokenizer_path
+    # No pre-generated stories, so every request is timed through the sampler
+    os.environ["STORY_POOL_SIZE"] = "0"
+    from fastapi.testclient import TestClient
+    from app.main import app as service
+
+    body = {"prefix": PREFIX, "max_length": args.max_length, "pace_ms": 0}
+    results = {}
+    # Unseeded, so the response cache never answers instead of the sampler either
+    with TestClient(service) as client:
+        for path in ("/generate", "/generate-stream"):
+            client.post(path, json=body)  # warm-up
+            samples = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                response = client.post(path, json=body)
+                response.raise_for_status()
+                samples.append(time.perf_counter() - start)
+            results[path] = summarize(samples)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the tokenizer, sampler and HTTP endpoints")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stories", type=int, default=20, help="Stories per generate_stream run (and corpus size / 10)")
+    parser.add_argument("--vocab-size", type=int, default=800, help="Tokenizer vocabulary size for the synthetic corpus")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per timed measurement")
+    parser.add_argument("--train-repeat", type=int, default=1, help="Runs of tokenizer training")
+    parser.add_argument("--full-train", action="store_true", help="Also time the full-recount BPE trainer (slow)")
+    parser.add_argument("--contexts", type=int, default=2000, help="Contexts for the distribution benchmark")
+    parser.add_argument("--max-length", type=int, default=700)
+    parser.add_argument("--cache-size", type=int, default=1024, help="Sampler CDF cache size")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per HTTP endpoint")
+    parser.add_argument("--skip-http", action="store_true", help="Skip the TestClient endpoint benchmarks")
+    parser.add_argument("--model", help="Benchmark this model file instead of one built from the synthetic corpus")
+    parser.add_argument("--tokenizer", help="Tokenizer pickle to use with --model")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if bool(args.model) != bool(args.tokenizer):
+        sys.exit("--model and --tokenizer must be given together")
+
+    stories = synthetic_stories(num_stories=args.stories * 10, seed=args.seed)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+    }
+
+    print("Benchmarking tokenizer...")
+    report["tokenizer"], tokenizer, encoded = bench_tokenizer(stories, args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.model:
+            model_paths = [os.path.abspath(args.model)]
+            tokenizer_path = os.path.abspath(args.tokenizer)
+            tokenizer = BPETokenizer()
+            tokenizer.load(tokenizer_path)
+        else:
+            # Both exports of the same counts; the service loads the binary one when it exists
+            model_paths = [os.path.join(tmp, "trigram_model.bin"), os.path.join(tmp, "trigram_model.pkl")]
+            tokenizer_path = os.path.join(tmp, "bpe_tokenizer.pkl")
+            build_models(encoded, tokenizer, model_paths[1], model_paths[0])
+            tokenizer.save(tokenizer_path)
+
+        print("Benchmarking model load...")
+        report["model"] = {}
+        loaders = {}
+        for path in model_paths:
+            model_format = "binary" if is_binary_model(path) else "pickle"
+            report["model"][model_format], loaders[path] = bench_load(path, args)
+        # The sampler and HTTP benchmarks use the first model, the binary export unless --model is given
+        model_path = model_paths[0]
+        loader = loaders[model_path]
+        print("Benchmarking sampler...")
+        report["sampler"] = bench_sampler(loader, tokenizer, args)
+        if not args.skip_http:
+            print("Benchmarking HTTP endpoints...")
+            report["http"] = bench_http(model_path, tokenizer_path, args)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import pickle
+import random
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+URDU_LETTERS = "ابپتٹثجچحخدڈذرڑزژسشصضطظعغفقکگلمنںوہھءیے"
+PUNCTUATION = ["۔", "؟", "!"]
+# Sentence and story markers, as inserted by the preprocessing notebook
+EOS, EOT = '\uFFF0', '\uFFF2'
+# Start id retrain_model.py pads stories with
+START_ID = 0
+
+
+def synthetic_stories(num_stories=300, sentences_per_story=20, lexicon_size=3000, seed=42):
+    """Reproducible Urdu-like stories with a Zipfian word distribution and preprocessing markers"""
+    rng = random.Random(seed)
+    lexicon = ["".join(rng.choice(URDU_LETTERS) for _ in range(rng.randint(2, 7))) for _ in range(lexicon_size)]
+    weights = [1.0 / (rank + 1) for rank in range(lexicon_size)]
+    stories = []
+    for _ in range(num_stories):
+        sentences = []
+        for _ in range(sentences_per_story):
+            words = rng.choices(lexicon, weights=weights, k=rng.randint(6, 14))
+            sentences.append(" ".join(words) + rng.choice(PUNCTUATION) + EOS)
+        stories.append(" ".join(sentences) + EOT)
+    return stories
+
+
+def build_models(token_lists, tokenizer, pickle_path: str, binary_path: str):
+    """Count token_lists with retrain_model.py and write its pickle and binary exports of the same counts"""
+    retrain_model = _retrain_model()
+    counts = retrain_model.NgramCounts.from_tokens(token_lists, START_ID)
+    model = retrain_model.TrigramLanguageModel()
+    model.load_counts(counts)
+    with open(pickle_path, 'wb') as f:
+        pickle.dump(model, f)
+    lambdas = (model.lambda1, model.lambda2, model.lambda3)
+    retrain_model.export_binary_model(retrain_model.build_binary_sections(counts), lambdas, counts.total_tokens,
+                                      binary_path, retrain_model.special_token_ids(tokenizer, START_ID))
+
+
+def _retrain_model():
+    """retrain_model.py from the repository root, so the benchmarks count n-grams exactly as training does"""
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    # retrain_model aliases bpe_tokenizer to its own module; keep whatever alias the caller set up
+    alias = sys.modules.get('bpe_tokenizer')
+    import retrain_model
+    if alias is not None:
+        sys.modules['bpe_tokenizer'] = alias
+    return retrain_model